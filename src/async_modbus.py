@@ -0,0 +1,87 @@
+import asyncio
+import struct
+
+import modbus_tk.defines as cst
+from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+
+
+class AsyncTcpMaster:
+    """Cliente Modbus TCP mínimo sobre asyncio (lectura de holding registers y escritura múltiple).
+
+    Imita la firma de modbus_tk.modbus_tcp.TcpMaster.execute para que la lógica
+    de los procesadores no cambie; un mismo bucle de eventos puede mantener
+    abiertas las conexiones de muchas estaciones sin un hilo por PLC.
+    """
+
+    def __init__(self, host="127.0.0.1", port=502, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._transaction_id = 0
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+
+    def _abort(self):
+        """Cierra sin esperar (sirve también durante una cancelación)"""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    def _build_pdu(self, function_code, starting_address, quantity_of_x, output_value):
+        if function_code == cst.READ_HOLDING_REGISTERS:
+            return struct.pack(">BHH", function_code, starting_address, quantity_of_x)
+        if function_code == cst.WRITE_MULTIPLE_REGISTERS:
+            values = list(output_value)
+            return struct.pack(f">BHHB{len(values)}H", function_code, starting_address,
+                               len(values), 2 * len(values), *values)
+        if function_code == cst.WRITE_SINGLE_REGISTER:
+            return struct.pack(">BHH", function_code, starting_address, output_value)
+        raise ModbusInvalidResponseError(f"Función Modbus no soportada: {function_code}")
+
+    async def execute(self, slave, function_code, starting_address, quantity_of_x=0, output_value=0):
+        """Ejecuta una petición Modbus y devuelve la tupla de valores (como modbus_tk)"""
+        pdu = self._build_pdu(function_code, starting_address, quantity_of_x, output_value)
+
+        async with self._lock:
+            try:
+                await self.open()
+                self._transaction_id = (self._transaction_id + 1) & 0xFFFF
+                mbap = struct.pack(">HHHB", self._transaction_id, 0, len(pdu) + 1, slave)
+                self._writer.write(mbap + pdu)
+                await asyncio.wait_for(self._writer.drain(), self.timeout)
+
+                header = await asyncio.wait_for(self._reader.readexactly(7), self.timeout)
+                transaction_id, _, length, _ = struct.unpack(">HHHB", header)
+                body = await asyncio.wait_for(self._reader.readexactly(length - 1), self.timeout)
+                if transaction_id != self._transaction_id:
+                    raise ModbusInvalidResponseError("Respuesta Modbus con id de transacción inesperado")
+            except BaseException:
+                # Error, timeout o cancelación con una respuesta en vuelo: la conexión queda en
+                # estado desconocido y una respuesta tardía desfasaría las siguientes; se reabre
+                self._abort()
+                raise
+
+        return_code = body[0]
+        if return_code > 0x80:
+            raise ModbusError(body[1])
+
+        if function_code == cst.READ_HOLDING_REGISTERS:
+            byte_count = body[1]
+            return struct.unpack(f">{byte_count // 2}H", body[2:2 + byte_count])
+        return struct.unpack(">HH", body[1:5])
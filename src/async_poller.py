@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+
+from async_modbus import AsyncTcpMaster
+from bigdata_sink import BigDataExporter, open_default_sink
+from bigdata_writer import BackgroundBigDataWriter
+from config import ProcessorConfig, load_config
+from dosing_table import get_dosing_table
+from metrics import MODBUS_ERRORS, configure_logging, span, start_metrics_server, stop_on_sigterm
+from pipeline import build_client_pipeline, log_actuation
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StationConfig:
+    """Estación de dosificación: conexión Modbus y temporización propia"""
+    name: str
+    ip: str
+    port: int = 502
+    unit_id: int = 1
+    interval: float = 2.0
+    timeout: float = 2.0
+
+
+def load_stations(path):
+    """Lee la lista de estaciones desde un JSON: [{"name": ..., "ip": ..., "port": ...}, ...]"""
+    with open(path, encoding="utf-8") as f:
+        return [StationConfig(**station) for station in json.load(f)]
+
+
+def build_station_pipeline(station, master, dosing_table, writer, config=None):
+    """Lazo en modo PLCClient de una estación con las opciones de 'config' (consulta, verificación, dificultad...)
+
+    La unidad y el intervalo de sondeo son los de la estación; 'master' puede
+    ser una conexión síncrona (ManagedConnection) o un AsyncTcpMaster.
+    """
+    config = config or ProcessorConfig()
+    return build_client_pipeline(master, dosing_table, writer, register_map=config.register_map(),
+                                 unit_id=station.unit_id, min_interval=min(config.min_interval, station.interval),
+                                 max_interval=station.interval, difficulty=config.difficulty_sheet(),
+                                 lookup_mode=config.lookup, verify_writes=config.verify_writes,
+                                 setpoint_refresh=config.setpoint_refresh)
+
+
+class AsyncPoller:
+    """Supervisa muchas estaciones desde un único bucle asyncio.
+
+    Cada estación tiene su lazo por etapas en modo PLCClient (filtro, tabla y
+    persistencia) pero sus lecturas y escrituras Modbus van por un
+    AsyncTcpMaster, así que ninguna estación bloquea a las demás. Todas
+    comparten las tablas de dosificación y un único escritor de BigData.
+    """
+
+    def __init__(self, stations, excel_path, export_interval=300, config=None):
+        self.stations = list(stations)
+        self.excel_path = excel_path
+        self.bigdata_sink = open_default_sink(excel_path)
+        self.bigdata_writer = BackgroundBigDataWriter(self.bigdata_sink)
+        self.bigdata_exporter = BigDataExporter(self.bigdata_sink, excel_path, interval=export_interval)
+
+        dosing_table = get_dosing_table(excel_path)
+        self.pipelines = {}
+        self.masters = {}
+        for station in self.stations:
+            master = AsyncTcpMaster(station.ip, station.port, timeout=station.timeout)
+            self.masters[station.name] = master
+            self.pipelines[station.name] = build_station_pipeline(station, master, dosing_table,
+                                                                  self.bigdata_writer, config)
+
+    async def poll_once(self, station):
+        """Un ciclo completo de una estación: lectura en bloque, decisión y escritura"""
+        pipeline = self.pipelines[station.name]
+        master = self.masters[station.name]
+
+        snapshot = await pipeline.acquirer.acquire_async(master)
+        decision = pipeline.decide(snapshot)
+
+        if decision is not None:
+            written = await pipeline.actuator.actuate_async(master, decision)
+            log_actuation(decision, written, prefix=f"[{station.name}] ")
+            pipeline.confirm(decision)
+
+    async def run_station(self, station):
+        loop = asyncio.get_running_loop()
+        next_poll = loop.time()
+        while True:
+            try:
+                # Sin límite global: cada petición ya tiene su timeout y cancelar a mitad
+                # de una transacción obligaría a reabrir la conexión
+                with span("ciclo"):
+                    await self.poll_once(station)
+            except Exception as e:
+                MODBUS_ERRORS.inc()
+                logger.error("[%s] Error en la comunicación Modbus: %r", station.name, e)
+                self.pipelines[station.name].actuator.reset()
+
+            # Intervalo por estación contado desde el inicio del ciclo anterior (sin deriva)
+            next_poll = max(next_poll + station.interval, loop.time())
+            await asyncio.sleep(next_poll - loop.time())
+
+    async def run(self):
+        self.bigdata_writer.start()
+        self.bigdata_exporter.start()
+        try:
+            await asyncio.gather(*(self.run_station(station) for station in self.stations))
+        finally:
+            for master in self.masters.values():
+                await master.close()
+            # Primero se vacía la cola de BigData y luego la exportación final la incluye
+            self.bigdata_writer.stop()
+            self.bigdata_exporter.stop()
+
+
+def main(argv=None):
+    # Misma configuración que los procesadores (archivo JSON, DOSIFICACION_* y argumentos) más --stations
+    config = load_config(argv, mode="client")
+    configure_logging(config.log_level)
+    stop_on_sigterm()
+    if config.metrics_port:
+        start_metrics_server(port=config.metrics_port)
+    poller = AsyncPoller(load_stations(config.stations), config.excel_path, config.export_interval, config=config)
+    try:
+        asyncio.run(poller.run())
+    except KeyboardInterrupt:
+        logger.info("Supervisión de estaciones detenida.")
+
+
+# Ejemplo de uso: python src/async_poller.py --stations estaciones.json --lookup interpolado
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import numpy as np
+
+# Rangos (inclusivos) de turbidez y promedio que definen filas y columnas de cada hoja de dificultad
+COLUMN_RANGES = [
+    (1, 15), (16, 25), (26, 50), (51, 75), (76, 100), (101, 125), (126, 150),
+    (151, 175), (176, 200), (201, 225), (226, 250), (251, 275), (276, 300),
+    (301, 350), (351, 400), (401, 450), (451, 500), (501, 550), (551, 600),
+    (601, 650), (651, 700), (701, 750), (751, 800), (801, 850), (851, 900),
+    (901, 950), (951, 1000)
+]
+
+# Posición de la primera banda dentro de cada hoja (índices 0-based, como df.iloc):
+# la banda 0 de turbidez es la fila 4 del DataFrame y la banda 0 de promedio la columna 'C'
+FIRST_ROW_INDEX = 3
+FIRST_COLUMN_INDEX = 2
+
+
+class BandIndex:
+    """Índice precalculado de bandas: clasifica escalares o arrays completos con np.searchsorted.
+
+    Un valor pertenece a la banda i si low_i <= valor <= high_i; los valores que
+    caen fuera de todos los rangos (o en los huecos entre ellos) devuelven -1.
+    """
+
+    def __init__(self, ranges=COLUMN_RANGES):
+        self.ranges = list(ranges)
+        self.lows = np.array([low for low, _ in self.ranges], dtype=float)
+        self.highs = np.array([high for _, high in self.ranges], dtype=float)
+        self.labels = [f"{low}-{high}" for low, high in self.ranges]
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def classify(self, values):
+        """Índice de banda de cada valor (-1 si no cae en ningún rango)"""
+        scalar = np.ndim(values) == 0
+        values = np.asarray(values, dtype=float)
+
+        bands = np.searchsorted(self.lows, values, side="right") - 1
+        valid = (bands >= 0) & (values <= self.highs[np.clip(bands, 0, None)])
+        bands = np.where(valid, bands, -1)
+
+        return int(bands) if scalar else bands
+
+    def locate(self, turbidez, promedio):
+        """Devuelve (fila, índice de columna) de la hoja: fila 1-based como en read_excel_value, -1 si no hay rango"""
+        turbidity_bands = np.asarray(self.classify(turbidez))
+        average_bands = np.asarray(self.classify(promedio))
+
+        rows = np.where(turbidity_bands >= 0, self.row_number(turbidity_bands), -1)
+        columns = np.where(average_bands >= 0, average_bands + FIRST_COLUMN_INDEX, -1)
+
+        if turbidity_bands.ndim == 0 and average_bands.ndim == 0:
+            return int(rows), int(columns)
+        return rows, columns
+
+    def label(self, band):
+        """Texto del rango ("low-high") tal como se guarda en BigData"""
+        return self.labels[band] if 0 <= band < len(self.labels) else None
+
+    @staticmethod
+    def row_number(band):
+        """Fila 1-based (criterio de read_excel_value) para una banda de turbidez"""
+        return band + FIRST_ROW_INDEX + 1
+
+    @staticmethod
+    def column_letter(band):
+        """Letra de columna usada por read_excel_value para una banda de promedio"""
+        return chr(ord('A') + FIRST_COLUMN_INDEX + band)
+
+
+# Índice compartido por ambos procesadores
+BAND_INDEX = BandIndex()
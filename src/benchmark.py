@@ -0,0 +1,156 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bigdata_sink import BIGDATA_SHEET, SqliteBigDataSink, make_record
+from bigdata_writer import BackgroundBigDataWriter
+from metrics import configure_logging
+from plc_procesor import PLCClient
+from simulator import PLCSimulator, batch_profile
+
+
+def percentiles(samples_ms):
+    """Resumen p50/p95/p99/máx de una lista de tiempos en milisegundos"""
+    if not samples_ms:
+        return {}
+    values = np.asarray(samples_ms)
+    return {
+        "n": len(values),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def bench_cycle_latency(excel_path, batches=50, port=5020):
+    """Ciclos de PLCClient contra el simulador: latencia por ciclo/decisión y peticiones Modbus por decisión"""
+    simulator = PLCSimulator(batch_profile(batches=batches), port=port)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    sink = SqliteBigDataSink(os.path.join(workdir, "bigdata.sqlite3"))
+    writer = BackgroundBigDataWriter(sink)
+    simulator.start()
+
+    cycle_ms = []
+    decision_ms = []
+    try:
+        client = PLCClient(ip="127.0.0.1", port=port, excel_path=excel_path,
+                           bigdata_sink=sink, bigdata_writer=writer)
+        writer.start()
+        while True:
+            start = time.perf_counter()
+            # Mismo ciclo que PLCClient.ejecutar, sin las esperas del planificador
+            decision = client.pipeline.step()
+            elapsed = (time.perf_counter() - start) * 1000
+            cycle_ms.append(elapsed)
+            if decision is not None:
+                decision_ms.append(elapsed)
+            if not simulator.step():
+                break
+        writer.stop()
+    finally:
+        simulator.stop()
+        sink.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    decisions = len(simulator.writes)
+    return {
+        "ciclo_ms": percentiles(cycle_ms),
+        "decision_ms": percentiles(decision_ms),
+        "decisiones": decisions,
+        "peticiones_modbus": simulator.requests,
+        "peticiones_por_decision": simulator.requests / decisions if decisions else None,
+    }
+
+
+def _legacy_excel_append(excel_path, record):
+    """Escritura original de BigData: leer la hoja completa, concatenar una fila y reescribirla"""
+    import pandas as pd
+
+    with pd.ExcelFile(excel_path) as xls:
+        if BIGDATA_SHEET in xls.sheet_names:
+            df_existing = pd.read_excel(xls, sheet_name=BIGDATA_SHEET)
+            df_final = pd.concat([df_existing, pd.DataFrame([record])], ignore_index=True)
+        else:
+            df_final = pd.DataFrame([record])
+    with pd.ExcelWriter(excel_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+        df_final.to_excel(writer, sheet_name=BIGDATA_SHEET, index=False)
+
+
+def bench_bigdata_writes(excel_path, history_sizes=(0, 1000, 10000, 100000), appends=50, legacy_max=10000):
+    """Coste de guardar un registro según el tamaño del historial: SQLite append vs. reescritura del Excel"""
+    import pandas as pd
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        for size in history_sizes:
+            history = [make_record(10.0, "Medio", 100, 5.5, "76-100") for _ in range(size)]
+
+            sink = SqliteBigDataSink(os.path.join(workdir, f"bigdata-{size}.sqlite3"))
+            sink.append_many(history)
+            sink_ms = []
+            for _ in range(appends):
+                start = time.perf_counter()
+                sink.append(make_record(10.0, "Medio", 100, 5.5, "76-100"))
+                sink_ms.append((time.perf_counter() - start) * 1000)
+            sink.close()
+
+            legacy_ms = []
+            if size <= legacy_max:
+                legacy_path = os.path.join(workdir, f"datos-{size}.xlsx")
+                shutil.copy(excel_path, legacy_path)
+                with pd.ExcelWriter(legacy_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+                    pd.DataFrame(history).to_excel(writer, sheet_name=BIGDATA_SHEET, index=False)
+                for _ in range(min(appends, 5)):
+                    start = time.perf_counter()
+                    _legacy_excel_append(legacy_path, make_record(10.0, "Medio", 100, 5.5, "76-100"))
+                    legacy_ms.append((time.perf_counter() - start) * 1000)
+
+            results.append({
+                "historial": size,
+                "sqlite_ms": percentiles(sink_ms),
+                "excel_ms": percentiles(legacy_ms),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _format(stats):
+    if not stats:
+        return "-"
+    return f"p50={stats['p50']:.2f} p95={stats['p95']:.2f} p99={stats['p99']:.2f} máx={stats['max']:.2f} (n={stats['n']})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del lazo de dosificación contra un PLC simulado")
+    parser.add_argument("--excel", default="data/datos.xlsx")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--history", type=int, nargs="*", default=[0, 1000, 10000, 100000])
+    parser.add_argument("--log-level", dest="log_level", default="ERROR",
+                        help="Nivel de log del lazo durante la medida (ERROR para no mezclarlo con los resultados)")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    latency = bench_cycle_latency(args.excel, batches=args.batches, port=args.port)
+    print("== Latencia del ciclo (ms) ==")
+    print(f"ciclo:    {_format(latency['ciclo_ms'])}")
+    print(f"decisión: {_format(latency['decision_ms'])}")
+    print(f"decisiones: {latency['decisiones']}, peticiones Modbus: {latency['peticiones_modbus']}, "
+          f"por decisión: {latency['peticiones_por_decision']}")
+
+    print("== Coste de escritura en BigData (ms por registro) ==")
+    for row in bench_bigdata_writes(args.excel, history_sizes=args.history):
+        print(f"historial={row['historial']:>7}  sqlite: {_format(row['sqlite_ms'])}")
+        print(f"{'':>17}  excel:  {_format(row['excel_ms'])}")
+
+
+# Ejemplo de uso: python src/benchmark.py --batches 100
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import sqlite3
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from band_index import BAND_INDEX
+from bigdata_sink import BIGDATA_COLUMNS, DATE_FORMAT, SqliteBigDataSink, rows_to_columns
+
+# Columnas de la tabla SQLite en el orden de BIGDATA_COLUMNS
+_SQL_COLUMNS = ("promedio", "dificultad", "valor", "dosificacion", "fecha", "rango")
+
+
+def _band_case(column="valor", band_index=BAND_INDEX):
+    """Expresión SQL que clasifica 'column' en su banda (mismo criterio que BandIndex.classify, -1 fuera)"""
+    cases = " ".join(
+        f"WHEN {column} BETWEEN {low} AND {high} THEN {band}" for band, (low, high) in enumerate(band_index.ranges)
+    )
+    return f"CASE {cases} ELSE -1 END"
+
+
+def _as_bound(value):
+    """Convierte un límite (datetime, date o texto) al formato de 'Fecha' para comparar en el índice"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, date):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+class BigDataQuery:
+    """Consultas de solo lectura sobre el historial SQLite de BigData.
+
+    Las búsquedas por rango de fechas (y dificultad) usan los índices de la
+    tabla y solo leen las filas del rango; los resultados salen por columnas
+    (arrays NumPy, 'Fecha' como datetime64) o como DataFrame si se pide.
+    """
+
+    def __init__(self, db_path):
+        if isinstance(db_path, SqliteBigDataSink):
+            db_path = db_path.db_path
+        self.db_path = db_path
+        # Conexión de solo lectura: con WAL no bloquea al escritor del lazo de control
+        self._conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                     check_same_thread=False)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _where(start, end, dificultad):
+        """Condiciones sobre fecha (inicio incluido, fin excluido) y dificultad, con sus parámetros"""
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("fecha >= ?")
+            params.append(_as_bound(start))
+        if end is not None:
+            conditions.append("fecha < ?")
+            params.append(_as_bound(end))
+        if dificultad is not None:
+            conditions.append("dificultad = ?")
+            params.append(dificultad)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def records(self, start=None, end=None, dificultad=None, as_frame=False):
+        """Registros con start <= Fecha < end (y de la dificultad indicada), ordenados por fecha"""
+        where, params = self._where(start, end, dificultad)
+        rows = self._conn.execute(
+            f"SELECT {', '.join(_SQL_COLUMNS)} FROM bigdata{where} ORDER BY fecha", params
+        ).fetchall()
+
+        columns = rows_to_columns(rows)
+        columns["Fecha"] = np.array(columns["Fecha"], dtype="datetime64[s]")
+        return self._to_frame(columns, BIGDATA_COLUMNS) if as_frame else columns
+
+    def count(self, start=None, end=None, dificultad=None):
+        where, params = self._where(start, end, dificultad)
+        return self._conn.execute(f"SELECT COUNT(*) FROM bigdata{where}", params).fetchone()[0]
+
+    def daily_band_means(self, start=None, end=None, dificultad=None, as_frame=False):
+        """Dosificación media por día, dificultad y banda de turbidez, agregada en SQLite
+
+        La banda se calcula desde 'Valor' (la turbidez), así que también cuenta los
+        registros antiguos sin 'Rango'.
+        """
+        where, params = self._where(start, end, dificultad)
+        rows = self._conn.execute(
+            f"SELECT substr(fecha, 1, 10) AS dia, dificultad, {_band_case()} AS banda, "
+            f"AVG(dosificacion), MIN(dosificacion), MAX(dosificacion), COUNT(*) "
+            f"FROM bigdata{where} GROUP BY dia, dificultad, banda ORDER BY dia, dificultad, banda",
+            params,
+        ).fetchall()
+
+        names = ("Día", "Dificultad", "Rango", "Dosificación media", "Dosificación mínima", "Dosificación máxima",
+                 "Registros")
+        day, difficulty, band, mean, minimum, maximum, count = zip(*rows) if rows else [()] * len(names)
+        columns = {
+            "Día": np.array(day, dtype="datetime64[D]"),
+            "Dificultad": np.array(difficulty, dtype=object),
+            "Rango": np.array([BAND_INDEX.label(b) for b in band], dtype=object),
+            "Dosificación media": np.array(mean, dtype=float),
+            "Dosificación mínima": np.array(minimum, dtype=float),
+            "Dosificación máxima": np.array(maximum, dtype=float),
+            "Registros": np.array(count, dtype=np.int64),
+        }
+        return self._to_frame(columns, names) if as_frame else columns
+
+    @staticmethod
+    def _to_frame(columns, names):
+        import pandas as pd
+
+        return pd.DataFrame({name: columns[name] for name in names})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta el historial de BigData por rango de fechas")
+    parser.add_argument("--historial", default="data/bigdata.sqlite3")
+    parser.add_argument("--desde", help="Fecha inicial incluida (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--hasta", help="Fecha final excluida; por defecto, el día siguiente a --desde")
+    parser.add_argument("--dificultad")
+    parser.add_argument("--diario", action="store_true", help="Dosificación media por día y banda de turbidez")
+    parser.add_argument("--csv", help="Guardar el resultado en un CSV en lugar de mostrarlo")
+    args = parser.parse_args()
+
+    end = args.hasta
+    if end is None and args.desde:
+        end = (datetime.strptime(args.desde[:10], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+    with BigDataQuery(args.historial) as query:
+        if args.diario:
+            df = query.daily_band_means(args.desde, end, args.dificultad, as_frame=True)
+        else:
+            df = query.records(args.desde, end, args.dificultad, as_frame=True)
+
+    if args.csv:
+        df.to_csv(args.csv, index=False)
+        print(f"{len(df)} filas guardadas en {args.csv}")
+    else:
+        print(df.to_string(index=False))
+
+
+# Ejemplo de uso: python src/bigdata_query.py --desde 2025-01-01 --hasta 2025-02-01 --dificultad Medio --diario
+if __name__ == "__main__":
+    main()
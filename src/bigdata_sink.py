@@ -0,0 +1,370 @@
+import collections
+import csv
+import glob
+import itertools
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from dosing_table import workbook_sheet_names
+
+logger = logging.getLogger(__name__)
+
+# Columnas de la hoja 'BigData' (mismo orden que en el Excel)
+BIGDATA_COLUMNS = ["Promedio", "Dificultad", "Valor", "Dosificación", "Fecha", "Rango"]
+NUMERIC_COLUMNS = ("Promedio", "Valor", "Dosificación")
+BIGDATA_SHEET = "BigData"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Filas de datos que caben en una hoja de Excel (1.048.576 menos el encabezado)
+EXCEL_MAX_ROWS = 1048575
+
+
+def make_record(promedio, dificultad, valor, dosificacion, rango=None, fecha=None):
+    """Construye un registro de BigData con la fecha actual si no se indica otra"""
+    return {
+        "Promedio": promedio,
+        "Dificultad": dificultad,
+        "Valor": valor,
+        "Dosificación": dosificacion,
+        "Fecha": fecha or datetime.now().strftime(DATE_FORMAT),
+        "Rango": rango
+    }
+
+
+def rows_to_columns(rows):
+    """Convierte tuplas de BigData en un diccionario de arrays por columna (numéricas como float)"""
+    columns = list(zip(*rows)) if rows else [()] * len(BIGDATA_COLUMNS)
+    return {
+        name: np.array(values, dtype=float if name in NUMERIC_COLUMNS else object)
+        for name, values in zip(BIGDATA_COLUMNS, columns)
+    }
+
+
+class BigDataSink:
+    """Destino de los registros de BigData. Cada append es O(1), independiente del historial."""
+
+    # Error de la importación inicial desde la hoja 'BigData' (ver open_default_sink); mientras
+    # esté fijado no se exporta, para no reemplazar la hoja con un historial incompleto
+    seed_error = None
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def iter_rows(self):
+        """Recorre los registros guardados como tuplas en el orden de BIGDATA_COLUMNS"""
+        raise NotImplementedError
+
+    def tail_rows(self, limit):
+        """Últimos 'limit' registros como tuplas, del más antiguo al más reciente"""
+        return list(collections.deque(self.iter_rows(), maxlen=limit))
+
+    def iter_batches(self, batch_size=50000):
+        """Recorre el historial en bloques de columnas (ver rows_to_columns) sin cargarlo entero"""
+        rows = iter(self.iter_rows())
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                return
+            yield rows_to_columns(chunk)
+
+    def to_dataframe(self, limit=None):
+        """Historial como DataFrame; con limit, solo los últimos 'limit' registros"""
+        import pandas as pd
+        rows = list(self.iter_rows()) if limit is None else self.tail_rows(limit)
+        return pd.DataFrame(rows, columns=BIGDATA_COLUMNS)
+
+    def close(self):
+        pass
+
+
+class SqliteBigDataSink(BigDataSink):
+    """BigData en SQLite con journal WAL: inserciones O(1) y lecturas que no bloquean al escritor"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bigdata ("
+            "promedio REAL, dificultad TEXT, valor REAL, dosificacion REAL, fecha TEXT, rango TEXT)"
+        )
+        # Índices para las consultas por rango de fechas y por dificultad (ver bigdata_query)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bigdata_fecha ON bigdata (fecha)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bigdata_dificultad_fecha ON bigdata (dificultad, fecha)")
+        self._conn.commit()
+
+    def append_many(self, records):
+        rows = [tuple(record.get(column) for column in BIGDATA_COLUMNS) for record in records]
+        with self._lock:
+            self._conn.executemany("INSERT INTO bigdata VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM bigdata").fetchone()[0]
+
+    def iter_rows(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT promedio, dificultad, valor, dosificacion, fecha, rango FROM bigdata ORDER BY rowid"
+            ).fetchall()
+        return iter(rows)
+
+    def tail_rows(self, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT promedio, dificultad, valor, dosificacion, fecha, rango FROM bigdata "
+                "ORDER BY rowid DESC LIMIT ?", (limit,)
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def iter_batches(self, batch_size=50000):
+        # Conexión de solo lectura propia: con WAL no bloquea al escritor mientras se recorre
+        conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(
+                "SELECT promedio, dificultad, valor, dosificacion, fecha, rango FROM bigdata ORDER BY rowid"
+            )
+            while True:
+                chunk = cursor.fetchmany(batch_size)
+                if not chunk:
+                    return
+                yield rows_to_columns(chunk)
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _csv_value(column, text):
+    """Valor de una celda CSV con el mismo tipo que en SQLite (numéricas como float, vacías como None)"""
+    if not text:
+        return None
+    return float(text) if column in NUMERIC_COLUMNS else text
+
+
+class CsvBigDataSink(BigDataSink):
+    """BigData en segmentos CSV diarios (bigdata-AAAAMMDD.csv) abiertos solo en modo append"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, record):
+        day = str(record.get("Fecha") or datetime.now().strftime(DATE_FORMAT))[:10].replace("-", "")
+        return os.path.join(self.directory, f"bigdata-{day}.csv")
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "bigdata-*.csv")))
+
+    def append_many(self, records):
+        with self._lock:
+            by_segment = {}
+            for record in records:
+                by_segment.setdefault(self._segment_path(record), []).append(record)
+
+            for path, segment_records in by_segment.items():
+                new_file = not os.path.exists(path)
+                with open(path, "a", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=BIGDATA_COLUMNS)
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerows(segment_records)
+
+    def count(self):
+        with self._lock:
+            total = 0
+            for path in self._segments():
+                with open(path, encoding="utf-8") as f:
+                    total += max(sum(1 for _ in f) - 1, 0)
+            return total
+
+    def iter_rows(self):
+        with self._lock:
+            segments = self._segments()
+        for path in segments:
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    yield tuple(_csv_value(column, row.get(column)) for column in BIGDATA_COLUMNS)
+
+
+def make_sink(kind, path):
+    """Crea el destino de BigData: 'sqlite' (archivo .sqlite3) o 'csv' (directorio de segmentos)"""
+    if kind == "sqlite":
+        return SqliteBigDataSink(path)
+    if kind == "csv":
+        return CsvBigDataSink(path)
+    raise ValueError(f"Tipo de destino BigData no soportado: {kind}")
+
+
+def default_sink_path(excel_path):
+    """Ruta por defecto del historial junto al libro: data/datos.xlsx -> data/bigdata.sqlite3"""
+    return os.path.join(os.path.dirname(excel_path) or ".", "bigdata.sqlite3")
+
+
+def open_default_sink(excel_path):
+    """Abre el historial SQLite por defecto y, si está vacío, lo siembra con la hoja 'BigData' del libro"""
+    sink = SqliteBigDataSink(default_sink_path(excel_path))
+    if sink.count() == 0:
+        try:
+            imported = import_from_excel(sink, excel_path)
+            if imported:
+                logger.info("Historial inicial importado desde '%s': %s registros.", BIGDATA_SHEET, imported)
+        except Exception as e:
+            sink.seed_error = e
+            logger.error("No se pudo importar el historial de '%s' (no se exportará BigData): %s", BIGDATA_SHEET, e)
+    return sink
+
+
+def import_from_excel(sink, excel_path, sheet_name=BIGDATA_SHEET):
+    """Copia al destino el historial existente en la hoja 'BigData' (migración inicial)"""
+    if not os.path.exists(excel_path):
+        return 0
+    # Comprobación barata en el índice del .xlsx antes de cargar pandas/openpyxl
+    sheet_names = workbook_sheet_names(excel_path)
+    if sheet_names is not None and sheet_name not in sheet_names:
+        return 0
+
+    import pandas as pd
+
+    with pd.ExcelFile(excel_path) as xls:
+        if sheet_name not in xls.sheet_names:
+            return 0
+        df = pd.read_excel(xls, sheet_name=sheet_name)
+
+    df = df.reindex(columns=BIGDATA_COLUMNS)
+    df = df.astype(object).where(df.notna(), None)
+    # Las fechas guardadas como fecha de Excel llegan como Timestamp: mismo texto que make_record
+    df["Fecha"] = df["Fecha"].map(lambda value: value.strftime(DATE_FORMAT) if isinstance(value, datetime) else value)
+    records = df.to_dict(orient="records")
+    sink.append_many(records)
+    return len(records)
+
+
+def sheet_row_count(excel_path, sheet_name=BIGDATA_SHEET):
+    """Filas de datos (sin el encabezado) de una hoja del libro, o 0 si el libro o la hoja no existen"""
+    if not os.path.exists(excel_path):
+        return 0
+    sheet_names = workbook_sheet_names(excel_path)
+    if sheet_names is not None and sheet_name not in sheet_names:
+        return 0
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(excel_path, read_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            return 0
+        worksheet = workbook[sheet_name]
+        rows = worksheet.max_row
+        if rows is None:
+            # Hoja sin dimensión declarada: contar recorriendo las filas
+            rows = sum(1 for _ in worksheet.iter_rows(values_only=True))
+        return max(rows - 1, 0)
+    finally:
+        workbook.close()
+
+
+def export_to_excel(sink, excel_path, sheet_name=BIGDATA_SHEET, max_rows=EXCEL_MAX_ROWS):
+    """Materializa el historial en la hoja 'BigData' sin tocar las demás hojas.
+
+    Se escribe sobre una copia temporal junto al libro y se sustituye con
+    os.replace, así DosingTable nunca ve el libro a medio escribir. Si el
+    historial no cabe en una hoja solo se exportan los últimos max_rows
+    registros (el historial completo sigue en el destino). Nunca se reemplaza
+    la hoja con menos filas de las que ya tiene ni si falló la importación inicial.
+    """
+    import pandas as pd
+
+    if sink.seed_error is not None:
+        raise RuntimeError(f"el historial no se importó de '{sheet_name}' ({sink.seed_error}); "
+                           "no se reemplaza la hoja")
+    total = sink.count()
+    existing = sheet_row_count(excel_path, sheet_name)
+    if min(total, max_rows) < existing:
+        raise RuntimeError(f"el historial ({total} registros) tiene menos filas que la hoja '{sheet_name}' "
+                           f"({existing}); no se reemplaza")
+    df_final = sink.to_dataframe(limit=max_rows if total > max_rows else None)
+    if total > max_rows:
+        logger.warning("El historial (%s registros) no cabe en la hoja '%s'; se exportan los últimos %s.",
+                       total, sheet_name, max_rows)
+
+    directory = os.path.dirname(os.path.abspath(excel_path))
+    # La extensión .xlsx es necesaria para que openpyxl abra la copia
+    fd, tmp_path = tempfile.mkstemp(prefix=".exportando-", suffix=".xlsx", dir=directory)
+    os.close(fd)
+    try:
+        exists = os.path.exists(excel_path)
+        if exists:
+            shutil.copy2(excel_path, tmp_path)
+        mode = "a" if exists else "w"
+        extra = {"if_sheet_exists": "replace"} if exists else {}
+        with pd.ExcelWriter(tmp_path, engine="openpyxl", mode=mode, **extra) as writer:
+            df_final.to_excel(writer, sheet_name=sheet_name, index=False)
+        os.replace(tmp_path, excel_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(df_final)
+
+
+class BigDataExporter:
+    """Exporta periódicamente el historial a la hoja 'BigData' para los operadores que abren el Excel"""
+
+    def __init__(self, sink, excel_path, interval=300):
+        self.sink = sink
+        self.excel_path = excel_path
+        self.interval = interval
+        self._exported_count = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def export_if_changed(self):
+        """Exporta solo si hay registros nuevos desde la última exportación"""
+        count = self.sink.count()
+        if count == self._exported_count:
+            return False
+        try:
+            export_to_excel(self.sink, self.excel_path)
+            self._exported_count = count
+            logger.info("✅ Hoja 'BigData' actualizada con %s registros.", count)
+            return True
+        except Exception as e:
+            logger.error("❌ Error al exportar BigData a Excel: %s", e)
+            return False
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.export_if_changed()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bigdata-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self, final_export=True):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if final_export:
+            self.export_if_changed()
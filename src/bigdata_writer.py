@@ -0,0 +1,128 @@
+import logging
+import queue
+import threading
+import time
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class BackgroundBigDataWriter:
+    """Hilo de escritura de BigData desacoplado del lazo de control.
+
+    Los registros se encolan en una cola acotada y un hilo en segundo plano los
+    escribe por lotes (al llegar a batch_size o cada flush_interval segundos).
+    submit() nunca bloquea: si la cola está llena se descarta el registro más
+    antiguo (drop_oldest) o el nuevo (drop_newest) y se cuenta en 'dropped'.
+    """
+
+    def __init__(self, sink, max_queue=1000, batch_size=50, flush_interval=1.0, drop_policy=DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Política de descarte no válida: {drop_policy}")
+
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def submit(self, record):
+        """Encola un registro sin bloquear; devuelve False si se descartó alguno"""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            pass
+
+        self.dropped += 1
+        if self.drop_policy == DROP_NEWEST:
+            return False
+
+        # drop_oldest: hacer sitio quitando el registro más antiguo
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            pass
+        return False
+
+    # Mismo interfaz que un BigDataSink, para poder usarlo en su lugar
+    append = submit
+
+    def _drain(self, first=None):
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            with span("bigdata_lote"):
+                self.sink.append_many(batch)
+            self.written += len(batch)
+        except Exception as e:
+            logger.error("❌ Error al escribir un lote de %s registros en BigData: %s", len(batch), e)
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        pending = []
+        while not self._stop_event.is_set():
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                record = self._queue.get(timeout=timeout)
+                pending.extend(self._drain(record))
+            except queue.Empty:
+                pass
+
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(pending)
+                pending = []
+                deadline = time.monotonic() + self.flush_interval
+
+        # Vaciar lo que quede al detener
+        pending.extend(self.drain_all())
+        self._write(pending)
+
+    def drain_all(self):
+        records = []
+        while True:
+            batch = self._drain()
+            if not batch:
+                return records
+            records.extend(batch)
+
+    def flush(self):
+        """Escribe en el hilo actual todo lo encolado (útil en pruebas o al cerrar sin hilo)"""
+        self._write(self.drain_all())
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="bigdata-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def qsize(self):
+        return self._queue.qsize()
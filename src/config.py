@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+from dataclasses import dataclass, field, fields
+
+from dosing_table import DIFFICULTIES
+from register_map import RegisterMap, Tag
+
+# Variables de entorno: DOSIFICACION_<CAMPO>, p. ej. DOSIFICACION_IP o DOSIFICACION_DIFFICULTY
+ENV_PREFIX = "DOSIFICACION_"
+CONFIG_ENV = ENV_PREFIX + "CONFIG"
+
+MODES = ("client", "excel")
+# Consulta de la tabla: celda de la banda o interpolación bilineal entre bandas (ver pipeline.LOOKUP_MODES)
+LOOKUP_MODES = ("discreto", "interpolado")
+
+# Intervalos de sondeo por defecto de cada modo (min, max) en segundos
+DEFAULT_INTERVALS = {"client": (0.2, 2.0), "excel": (5.0, 5.0)}
+
+
+@dataclass
+class ProcessorConfig:
+    """Configuración de un procesador sin interacción por consola.
+
+    Se combina, de menor a mayor prioridad: valores por defecto, archivo JSON
+    (--config o DOSIFICACION_CONFIG), variables DOSIFICACION_* y línea de comandos.
+    Con difficulty=None la dificultad se lee del PLC en difficulty_register.
+    """
+    mode: str = "client"
+    ip: str = "127.0.0.1"
+    port: int = 502
+    unit_id: int = 1
+    excel_path: str = "data/datos.xlsx"
+    difficulty: object = None
+    difficulty_register: int = 2
+    row_register: int = 0
+    registers: dict = field(default_factory=dict)
+    register_gap: int = 0
+    lookup: str = "discreto"
+    verify_writes: bool = False
+    setpoint_refresh: float = 60.0
+    min_interval: float = None
+    max_interval: float = None
+    export_interval: float = 300
+    metrics_port: int = 0
+    log_level: str = None
+    # Solo async_poller y fleet: lista de estaciones y procesos (0 = uno por CPU)
+    stations: str = "data/estaciones.json"
+    workers: int = 0
+
+    def __post_init__(self):
+        if self.mode not in MODES:
+            raise ValueError(f"Modo no válido: {self.mode} (opciones: {', '.join(MODES)})")
+        if self.lookup not in LOOKUP_MODES:
+            raise ValueError(f"Consulta no válida: {self.lookup} (opciones: {', '.join(LOOKUP_MODES)})")
+        default_min, default_max = DEFAULT_INTERVALS[self.mode]
+        if self.min_interval is None:
+            self.min_interval = default_min
+        if self.max_interval is None:
+            self.max_interval = max(default_max, self.min_interval)
+        # Valida la dificultad al cargar la configuración y no en el primer ciclo
+        self.difficulty_sheet()
+
+    def difficulty_sheet(self):
+        """Hoja de la dificultad fija (acepta 1-5 o el nombre de la hoja), o None si se lee del PLC"""
+        if self.difficulty in (None, ""):
+            return None
+        if isinstance(self.difficulty, str) and self.difficulty.isdigit():
+            self.difficulty = int(self.difficulty)
+        if self.difficulty in DIFFICULTIES:
+            return DIFFICULTIES[self.difficulty]
+        if self.difficulty in DIFFICULTIES.values():
+            return self.difficulty
+        raise ValueError(f"Dificultad no válida: {self.difficulty}")
+
+    def register_map(self):
+        """Mapa de registros configurado ({"turbidez": {"address": 0}, ...}) o None para el de por defecto"""
+        if not self.registers:
+            return None
+        return RegisterMap([Tag(name, **spec) for name, spec in self.registers.items()], max_gap=self.register_gap)
+
+
+def _parse_env_value(config_field, value):
+    if config_field.type is bool:
+        return value.strip().lower() in ("1", "true", "si", "sí", "yes")
+    if config_field.type is int:
+        return int(value)
+    if config_field.type is float:
+        return float(value)
+    if config_field.type is dict:
+        return json.loads(value)
+    return value
+
+
+def _from_env(environ):
+    values = {}
+    for config_field in fields(ProcessorConfig):
+        value = environ.get(ENV_PREFIX + config_field.name.upper())
+        if value is not None:
+            values[config_field.name] = _parse_env_value(config_field, value)
+    return values
+
+
+def build_parser(description="Procesador de dosificación"):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--config", help=f"Archivo JSON de configuración (o {CONFIG_ENV})")
+    parser.add_argument("--ip")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--unit-id", dest="unit_id", type=int)
+    parser.add_argument("--excel", dest="excel_path")
+    parser.add_argument("--difficulty", help="Dificultad fija (1-5 o nombre de hoja); si se omite se lee del PLC")
+    parser.add_argument("--difficulty-register", dest="difficulty_register", type=int)
+    parser.add_argument("--row-register", dest="row_register", type=int)
+    parser.add_argument("--register-gap", dest="register_gap", type=int,
+                        help="Registros sin usar que puede saltar una lectura en bloque (0: solo contiguos)")
+    parser.add_argument("--lookup", choices=LOOKUP_MODES, help="Celda de la banda o interpolación entre bandas")
+    parser.add_argument("--verify-writes", dest="verify_writes", action="store_true", default=None,
+                        help="Releer los registros tras cada escritura de consigna")
+    parser.add_argument("--setpoint-refresh", dest="setpoint_refresh", type=float,
+                        help="Segundos tras los que se reenvía una consigna aunque no haya cambiado")
+    parser.add_argument("--min-interval", dest="min_interval", type=float)
+    parser.add_argument("--max-interval", dest="max_interval", type=float)
+    parser.add_argument("--export-interval", dest="export_interval", type=float)
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int,
+                        help="Puerto de /metrics (0, por defecto, lo desactiva); uno distinto por procesador")
+    parser.add_argument("--log-level", dest="log_level")
+    parser.add_argument("--stations", help="JSON con las estaciones (async_poller y fleet)")
+    parser.add_argument("--workers", type=int, help="Procesos de fleet (0 = uno por CPU)")
+    return parser
+
+
+def load_config(argv=None, environ=None, mode=None, **defaults):
+    """Carga la configuración combinando archivo, entorno y argumentos.
+
+    'mode' es el del procesador que se arranca: un archivo o DOSIFICACION_MODE
+    con otro modo es un error, no se ejecuta un procesador con la configuración de otro.
+    """
+    environ = os.environ if environ is None else environ
+    args = vars(build_parser().parse_args(argv))
+
+    values = dict(defaults)
+    if mode is not None:
+        values["mode"] = mode
+    config_path = args.pop("config") or environ.get(CONFIG_ENV)
+    if config_path:
+        with open(config_path, encoding="utf-8") as f:
+            values.update(json.load(f))
+    values.update(_from_env(environ))
+    values.update({key: value for key, value in args.items() if value is not None})
+
+    if mode is not None and values["mode"] != mode:
+        raise ValueError(f"Este procesador funciona en modo '{mode}', no '{values['mode']}'")
+
+    unknown = set(values) - {config_field.name for config_field in fields(ProcessorConfig)}
+    if unknown:
+        raise ValueError(f"Claves de configuración desconocidas: {', '.join(sorted(unknown))}")
+    return ProcessorConfig(**values)
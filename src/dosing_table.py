@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from band_index import FIRST_COLUMN_INDEX, FIRST_ROW_INDEX
+from table_cache import default_cache_paths, load_tables, save_tables
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = {
+    1: "Muy Fácil",
+    2: "Fácil",
+    3: "Medio",
+    4: "Difícil",
+    5: "Muy Difícil"
+}
+
+# Espacios de nombres usados dentro del .xlsx (workbook.xml y sus relaciones)
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def sheet_parts(zf):
+    """Devuelve {nombre de hoja: ruta del XML dentro del .xlsx}"""
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{_NS_PKG_REL}Relationship")}
+
+    parts = {}
+    for sheet in workbook.iter(f"{_NS_MAIN}sheet"):
+        target = targets.get(sheet.get(f"{_NS_REL}id"), "")
+        parts[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+    return parts
+
+
+def workbook_sheet_names(excel_path):
+    """Nombres de las hojas leídos del índice del .xlsx sin abrir el libro (None si no se puede)"""
+    try:
+        with zipfile.ZipFile(excel_path) as zf:
+            return list(sheet_parts(zf))
+    except (OSError, zipfile.BadZipFile, KeyError, ET.ParseError):
+        return None
+
+
+class DosingTable:
+    """Tablas de dosificación precargadas en memoria (una matriz NumPy por hoja de dificultad).
+
+    El libro se lee una sola vez; en cada consulta solo se comprueba el mtime del
+    archivo y, si cambió, la huella de las hojas de dificultad. Solo se recarga
+    cuando esas hojas cambian de verdad (escribir en 'BigData' no provoca recarga).
+
+    Las hojas se compilan en un caché binario junto al libro (ver table_cache) que
+    se abre con mmap en el siguiente arranque mientras la huella no cambie; solo
+    si el caché falta o está desfasado se vuelve a leer el Excel con pandas.
+    """
+
+    def __init__(self, excel_path, sheet_names=None, use_cache=True, cache_path=None):
+        self.excel_path = excel_path
+        self.sheet_names = list(sheet_names or DIFFICULTIES.values())
+        self.use_cache = use_cache
+        self.cache_path = cache_path or default_cache_paths(excel_path)
+        self.tables = {}
+        self._mtime = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def compute_fingerprint(self):
+        """Huella de las hojas de dificultad a partir de los CRC32 del directorio del zip (sin descomprimir)"""
+        try:
+            with zipfile.ZipFile(self.excel_path) as zf:
+                parts = sheet_parts(zf)
+                return tuple(
+                    (name, zf.getinfo(parts[name]).CRC if name in parts else None)
+                    for name in self.sheet_names
+                )
+        except (zipfile.BadZipFile, KeyError, ET.ParseError):
+            # Formato inesperado: usar el hash completo del archivo
+            with open(self.excel_path, "rb") as f:
+                return hashlib.sha1(f.read()).hexdigest()
+
+    def _read_excel(self):
+        """Lee todas las hojas de dificultad de una vez y las convierte en matrices float"""
+        import pandas as pd
+
+        sheets = pd.read_excel(self.excel_path, sheet_name=self.sheet_names)
+        tables = {}
+        for name, df in sheets.items():
+            # Las celdas no numéricas (encabezados, rótulos de rango) quedan como NaN
+            numeric = df.apply(pd.to_numeric, errors="coerce")
+            tables[name] = np.ascontiguousarray(numeric.to_numpy(dtype=float))
+        return tables
+
+    def write_cache(self):
+        """Compila las tablas cargadas en el caché binario"""
+        save_tables(self.tables, self.sheet_names, self._fingerprint, self.cache_path)
+
+    def reload(self):
+        """Carga las tablas desde el caché si es válido o, si no, desde el Excel (regenerando el caché)"""
+        with self._lock:
+            mtime = os.path.getmtime(self.excel_path)
+            fingerprint = self.compute_fingerprint()
+
+            tables = load_tables(self.sheet_names, fingerprint, self.cache_path) if self.use_cache else None
+            from_cache = tables is not None
+            if not from_cache:
+                tables = self._read_excel()
+
+            self.tables = tables
+            self._mtime = mtime
+            self._fingerprint = fingerprint
+
+            if self.use_cache and not from_cache:
+                try:
+                    self.write_cache()
+                except OSError as e:
+                    logger.warning("No se pudo escribir el caché de tablas %s: %s", self.cache_path[0], e)
+
+            logger.info("Tablas de dosificación cargadas%s: %s",
+                        " (caché)" if from_cache else "", ", ".join(self.tables))
+
+    def refresh_if_changed(self):
+        """Recarga las tablas solo si el mtime y la huella de las hojas han cambiado.
+
+        Si el libro no se puede leer (p. ej. a medio guardar) se siguen usando las
+        últimas tablas válidas y se reintenta en el siguiente cambio de mtime.
+        """
+        try:
+            mtime = os.path.getmtime(self.excel_path)
+        except OSError:
+            return False
+
+        if mtime == self._mtime:
+            return False
+
+        try:
+            fingerprint = self.compute_fingerprint()
+            if fingerprint == self._fingerprint:
+                self._mtime = mtime
+                return False
+
+            logger.info("Cambios detectados en las hojas de dificultad, recargando tablas...")
+            self.reload()
+            return True
+        except Exception as e:
+            self._mtime = mtime
+            logger.error("No se pudieron recargar las tablas de '%s', se mantienen las anteriores: %s",
+                         self.excel_path, e)
+            return False
+
+    def get_value(self, sheet_name, row_index, column_index):
+        """Valor de la tabla por índices 0-based (mismo criterio que df.iloc), o None si no es numérico"""
+        self.refresh_if_changed()
+
+        table = self.tables.get(sheet_name)
+        if table is None:
+            return None
+        if not (0 <= row_index < table.shape[0] and 0 <= column_index < table.shape[1]):
+            return None
+
+        value = table[row_index, column_index]
+        if np.isnan(value):
+            return None
+        return float(value)
+
+    def lookup(self, difficulty, turbidity_band, average_band):
+        """Dosificación por (dificultad, banda de turbidez, banda de promedio) en O(1)"""
+        sheet_name = DIFFICULTIES.get(difficulty, difficulty)
+        return self.get_value(sheet_name, FIRST_ROW_INDEX + turbidity_band, FIRST_COLUMN_INDEX + average_band)
+
+    def get_cell(self, sheet_name, column, row):
+        """Equivalente a read_excel_value: columna en letra ('C') y fila 1-based sobre el DataFrame"""
+        column_index = ord(column.upper()) - ord('A')
+        return self.get_value(sheet_name, row - 1, column_index)
+
+
+_shared_tables = {}
+_shared_lock = threading.Lock()
+
+
+def get_dosing_table(excel_path):
+    """Devuelve una instancia compartida de DosingTable por ruta de archivo"""
+    key = os.path.abspath(excel_path)
+    with _shared_lock:
+        table = _shared_tables.get(key)
+        if table is None:
+            table = DosingTable(excel_path)
+            _shared_tables[key] = table
+        return table
@@ -0,0 +1,243 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from async_poller import build_station_pipeline, load_stations
+from bigdata_sink import BigDataExporter, open_default_sink
+from bigdata_writer import BackgroundBigDataWriter
+from config import load_config
+from dosing_table import get_dosing_table
+from metrics import BIGDATA_DROPPED, REGISTRY, configure_logging, start_metrics_server, stop_on_sigterm
+from shared_tables import SharedTablePublisher
+
+logger = logging.getLogger(__name__)
+
+WORKER_RESTARTS = REGISTRY.counter("dosificacion_reinicios_worker_total", "Procesos de estaciones reiniciados")
+
+
+def shard_stations(stations, workers):
+    """Reparte las estaciones entre los procesos por turnos (siempre el mismo reparto para el mismo orden)"""
+    shards = [[] for _ in range(max(1, min(workers, len(stations))))]
+    for i, station in enumerate(stations):
+        shards[i % len(shards)].append(station)
+    return shards
+
+
+class QueueRecordForwarder:
+    """Escritor de BigData de los procesos hijos: envía cada registro al supervisor"""
+
+    def __init__(self, record_queue):
+        self.record_queue = record_queue
+        self.dropped = 0
+
+    def submit(self, record):
+        try:
+            self.record_queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+
+def worker_metrics_port(metrics_port, index):
+    """Puerto de /metrics del proceso hijo 'index' (0 si el supervisor no expone métricas)"""
+    return metrics_port + 1 + index if metrics_port else 0
+
+
+def _worker_main(index, stations, table_prefix, generation, record_queue, stop_flag, log_level,
+                 config=None, metrics_port=0, poll_interval=0.2):
+    """Proceso hijo: un hilo con el lazo en modo PLCClient por estación, con tablas y BigData compartidos"""
+    # Importaciones aquí: el proceso hijo arranca por 'spawn' y solo carga lo que usa
+    from modbus_pool import get_connection
+    from shared_tables import SharedDosingTable
+
+    configure_logging(log_level)
+    if metrics_port:
+        # Cada proceso tiene su propio REGISTRY: lo expone en su puerto (supervisor + 1 + índice)
+        start_metrics_server(port=metrics_port)
+    dosing_table = SharedDosingTable(table_prefix, generation)
+    forwarder = QueueRecordForwarder(record_queue)
+
+    for station in stations:
+        master = get_connection(station.ip, station.port, timeout=station.timeout)
+        pipeline = build_station_pipeline(station, master, dosing_table, forwarder, config)
+        threading.Thread(target=pipeline.run, name=f"estacion-{station.name}", daemon=True).start()
+
+    logger.info("Worker %s en marcha (pid %s): %s", index, os.getpid(), ", ".join(s.name for s in stations))
+    # Indicador sin candados: un hermano que muera esperando no puede dejarlo bloqueado (a diferencia de un Event)
+    while not stop_flag.value:
+        time.sleep(poll_interval)
+
+
+class FleetSupervisor:
+    """Reparte las estaciones entre varios procesos y supervisa que sigan vivos.
+
+    Las tablas de dosificación se leen una vez aquí y se publican en memoria
+    compartida; los procesos hijos solo las mapean. Los registros de BigData de
+    todos los procesos llegan por una cola a un único escritor (y exportador).
+    Un proceso que muere se reinicia con la misma partición de estaciones,
+    esperando cada vez el doble (hasta restart_max) si vuelve a caer enseguida.
+    Las opciones del lazo (consulta, verificación, dificultad...) salen de
+    'config'; con metrics_port cada proceso hijo expone sus propias métricas
+    en metrics_port + 1 + índice.
+    """
+
+    def __init__(self, stations, excel_path, workers=None, export_interval=300, max_queue=10000,
+                 restart_base=1.0, restart_max=60.0, check_interval=1.0, log_level=None, config=None,
+                 metrics_port=0):
+        self.stations = list(stations)
+        self.excel_path = excel_path
+        self.config = config
+        self.metrics_port = metrics_port
+        self.shards = shard_stations(self.stations, workers or os.cpu_count() or 1)
+        self.restart_base = restart_base
+        self.restart_max = restart_max
+        self.check_interval = check_interval
+        self.log_level = log_level
+
+        self._context = multiprocessing.get_context("spawn")
+        self._generation = self._context.Value("q", 0, lock=False)
+        self._stop_flag = self._context.Value("b", 0, lock=False)
+        self._stop_event = threading.Event()
+        self._collector_stop = threading.Event()
+        self.max_queue = max_queue
+        self._table_prefix = f"dosificacion-{os.getpid()}"
+
+        self.publisher = None
+        self.bigdata_sink = open_default_sink(excel_path)
+        self.bigdata_writer = BackgroundBigDataWriter(self.bigdata_sink)
+        self.bigdata_exporter = BigDataExporter(self.bigdata_sink, excel_path, interval=export_interval)
+
+        self.processes = [None] * len(self.shards)
+        # Una cola por proceso: si uno muere con el candado de su cola tomado no bloquea a los demás
+        self._record_queues = [None] * len(self.shards)
+        self.restarts = [0] * len(self.shards)
+        self._failures = [0] * len(self.shards)
+        self._started_at = [0.0] * len(self.shards)
+        self._restart_at = [None] * len(self.shards)
+        self._collector = None
+
+    def _spawn(self, index):
+        if self._record_queues[index] is not None:
+            self._drain(self._record_queues[index])
+        self._record_queues[index] = self._context.Queue(maxsize=self.max_queue)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.shards[index], self._table_prefix, self._generation,
+                  self._record_queues[index], self._stop_flag, self.log_level, self.config,
+                  worker_metrics_port(self.metrics_port, index)),
+            name=f"dosificacion-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    def _drain(self, record_queue):
+        drained = 0
+        while True:
+            try:
+                record = record_queue.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                return drained
+            drained += 1
+            if not self.bigdata_writer.submit(record):
+                BIGDATA_DROPPED.inc()
+
+    def _collect(self, poll_interval=0.05):
+        """Hilo que pasa los registros de los procesos hijos al escritor único"""
+        while not self._collector_stop.is_set():
+            drained = sum(self._drain(record_queue) for record_queue in list(self._record_queues)
+                          if record_queue is not None)
+            if not drained:
+                self._collector_stop.wait(poll_interval)
+
+    def check_workers(self):
+        """Reinicia los procesos caídos (con espera creciente si caen nada más arrancar)"""
+        now = time.monotonic()
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            if self._restart_at[index] is None:
+                # Si llevaba un rato en marcha se empieza de nuevo con la espera base
+                if now - self._started_at[index] > self.restart_max:
+                    self._failures[index] = 0
+                delay = min(self.restart_base * 2 ** self._failures[index], self.restart_max)
+                self._failures[index] += 1
+                self._restart_at[index] = now + delay
+                logger.error("Worker %s terminó (código %s); reinicio en %.1f s", index, process.exitcode, delay)
+            if now >= self._restart_at[index]:
+                self._restart_at[index] = None
+                self.restarts[index] += 1
+                WORKER_RESTARTS.inc()
+                self._spawn(index)
+
+    def start(self):
+        self.publisher = SharedTablePublisher(get_dosing_table(self.excel_path), self._table_prefix, self._generation)
+        self.bigdata_writer.start()
+        self.bigdata_exporter.start()
+        self._collector = threading.Thread(target=self._collect, name="bigdata-collector", daemon=True)
+        self._collector.start()
+        for index in range(len(self.shards)):
+            self._spawn(index)
+            if self.metrics_port:
+                logger.info("Métricas del worker %s en el puerto %s", index,
+                            worker_metrics_port(self.metrics_port, index))
+
+    def run(self):
+        self.start()
+        try:
+            while not self._stop_event.wait(self.check_interval):
+                self.check_workers()
+                # Cambios en las hojas del Excel: nueva generación en memoria compartida
+                self.publisher.refresh_if_changed()
+        finally:
+            self.stop()
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        self._stop_flag.value = 1
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        if self._collector is not None:
+            self._collector_stop.set()
+            self._collector.join()
+            self._collector = None
+        for record_queue in self._record_queues:
+            if record_queue is not None:
+                self._drain(record_queue)
+        # Primero se vacía la cola de BigData y luego la exportación final la incluye
+        self.bigdata_writer.stop()
+        self.bigdata_exporter.stop()
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+
+
+def main(argv=None):
+    # Misma configuración que los procesadores más --stations y --workers
+    config = load_config(argv, mode="client")
+    configure_logging(config.log_level)
+    stop_on_sigterm()
+    if config.metrics_port:
+        start_metrics_server(port=config.metrics_port)
+    supervisor = FleetSupervisor(load_stations(config.stations), excel_path=config.excel_path,
+                                 workers=config.workers or None, export_interval=config.export_interval,
+                                 log_level=config.log_level, config=config, metrics_port=config.metrics_port)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        logger.info("Flota detenida.")
+
+
+# Ejemplo de uso: python src/fleet.py --stations estaciones.json --workers 4 --metrics-port 9108
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import bisect
+import math
+import threading
+
+import numpy as np
+
+from band_index import BAND_INDEX, FIRST_COLUMN_INDEX, FIRST_ROW_INDEX
+from dosing_table import DIFFICULTIES
+
+
+class BilinearSheet:
+    """Interpolación bilineal de una hoja de dificultad sobre los puntos medios de las bandas.
+
+    Para cada celda de la malla (entre cuatro puntos medios vecinos) se
+    precalculan los coeficientes de f(u, v) = a + b·u + c·v + d·u·v, con u y v
+    la posición relativa dentro de la celda. Evaluar cuesta dos búsquedas
+    binarias y un producto, igual que una consulta directa. Fuera de la tabla
+    los valores se recortan al borde; si falta algún vértice se usa la celda
+    más cercana de la hoja.
+    """
+
+    def __init__(self, table, band_index=BAND_INDEX):
+        midpoints = (band_index.lows + band_index.highs) / 2
+        rows = max(min(len(band_index), table.shape[0] - FIRST_ROW_INDEX), 0)
+        columns = max(min(len(band_index), table.shape[1] - FIRST_COLUMN_INDEX), 0)
+        if rows == 0 or columns == 0:
+            raise ValueError("La hoja no contiene ninguna banda")
+
+        grid = np.asarray(table[FIRST_ROW_INDEX:FIRST_ROW_INDEX + rows,
+                                FIRST_COLUMN_INDEX:FIRST_COLUMN_INDEX + columns], dtype=float)
+        # Con una sola banda en un eje se repite para tener siempre celdas de 2x2
+        if rows == 1:
+            grid = np.repeat(grid, 2, axis=0)
+        if columns == 1:
+            grid = np.repeat(grid, 2, axis=1)
+
+        self.grid = grid
+        self.turbidity_points = midpoints[:rows] if rows > 1 else midpoints[0] + np.array([0.0, 1.0])
+        self.average_points = midpoints[:columns] if columns > 1 else midpoints[0] + np.array([0.0, 1.0])
+
+        f00 = grid[:-1, :-1]
+        f10 = grid[1:, :-1]
+        f01 = grid[:-1, 1:]
+        f11 = grid[1:, 1:]
+        self.coefficients = np.stack([f00, f10 - f00, f01 - f00, f11 - f10 - f01 + f00], axis=-1)
+
+        # Copias en listas para el caso escalar del lazo (evita el coste fijo de NumPy por llamada)
+        self._turbidity_list = self.turbidity_points.tolist()
+        self._average_list = self.average_points.tolist()
+        self._coefficient_list = self.coefficients.tolist()
+        self._grid_list = grid.tolist()
+
+    @staticmethod
+    def _locate(points, values):
+        """Celda y posición relativa (0..1, recortada) de cada valor sobre los puntos medios"""
+        cells = np.clip(np.searchsorted(points, values, side="right") - 1, 0, len(points) - 2)
+        spans = points[cells + 1] - points[cells]
+        offsets = np.clip((values - points[cells]) / spans, 0.0, 1.0)
+        return cells, offsets
+
+    @staticmethod
+    def _locate_scalar(points, value):
+        cell = min(max(bisect.bisect_right(points, value) - 1, 0), len(points) - 2)
+        offset = min(max((value - points[cell]) / (points[cell + 1] - points[cell]), 0.0), 1.0)
+        return cell, offset
+
+    def _evaluate_scalar(self, turbidez, promedio):
+        row, u = self._locate_scalar(self._turbidity_list, float(turbidez))
+        column, v = self._locate_scalar(self._average_list, float(promedio))
+        a, b, c, d = self._coefficient_list[row][column]
+        result = a + b * u + c * v + d * u * v
+        if math.isnan(result):
+            result = self._grid_list[row + round(u)][column + round(v)]
+        return result
+
+    def evaluate(self, turbidez, promedio):
+        """Dosificación interpolada para escalares o arrays (se difunden como en NumPy)"""
+        if np.ndim(turbidez) == 0 and np.ndim(promedio) == 0:
+            return self._evaluate_scalar(turbidez, promedio)
+
+        turbidez, promedio = np.broadcast_arrays(np.asarray(turbidez, dtype=float),
+                                                 np.asarray(promedio, dtype=float))
+
+        rows, u = self._locate(self.turbidity_points, turbidez)
+        columns, v = self._locate(self.average_points, promedio)
+        a, b, c, d = np.moveaxis(self.coefficients[rows, columns], -1, 0)
+        result = a + b * u + c * v + d * u * v
+
+        missing = np.isnan(result)
+        if missing.any():
+            # Vértice vacío en la hoja: valor de la celda más cercana (puede seguir siendo NaN)
+            nearest = self.grid[rows + np.rint(u).astype(int), columns + np.rint(v).astype(int)]
+            result = np.where(missing, nearest, result)
+        return result
+
+
+class InterpolatedTables:
+    """Coeficientes bilineales de cada hoja de un DosingTable, recalculados si las tablas cambian"""
+
+    def __init__(self, dosing_table, band_index=BAND_INDEX):
+        self.dosing_table = dosing_table
+        self.band_index = band_index
+        self.sheets = {}
+        self._source = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        self.dosing_table.refresh_if_changed()
+        tables = self.dosing_table.tables
+        if tables is self._source:
+            return
+        with self._lock:
+            if tables is not self._source:
+                self.sheets = {name: BilinearSheet(table, self.band_index) for name, table in tables.items()}
+                self._source = tables
+
+    def evaluate(self, sheet_name, turbidez, promedio):
+        """Dosificación interpolada en la hoja indicada (1-5 o nombre); None si la hoja no existe"""
+        self._refresh()
+        sheet = self.sheets.get(DIFFICULTIES.get(sheet_name, sheet_name))
+        if sheet is None:
+            return None
+        return sheet.evaluate(turbidez, promedio)
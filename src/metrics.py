@@ -0,0 +1,165 @@
+import bisect
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites de los histogramas en segundos (de 100 µs a 10 s)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class MetricsRegistry:
+    """Contadores e histogramas en memoria, exportables en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help_text, labels, **options):
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = Counter() if kind == "counter" else Histogram(**options)
+                    self._metrics[key] = metric
+                    self._help.setdefault(name, (kind, help_text))
+        return metric
+
+    def counter(self, name, help_text="", labels=None):
+        return self._get("counter", name, help_text, labels)
+
+    def histogram(self, name, help_text="", labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get("histogram", name, help_text, labels, buckets=buckets)
+
+    @contextmanager
+    def span(self, name):
+        """Mide la duración del bloque y la acumula en dosificacion_span_seconds{span=name}"""
+        histogram = self.histogram("dosificacion_span_seconds", "Duración de cada etapa del lazo de dosificación",
+                                   labels={"span": name})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus"""
+        # Copia bajo el candado: el lazo puede crear series nuevas (p. ej. un span) mientras se sirve /metrics
+        with self._lock:
+            metrics = list(self._metrics.items())
+            help_texts = dict(self._help)
+
+        lines = []
+        by_name = {}
+        for (name, labels), metric in sorted(metrics, key=lambda item: item[0]):
+            by_name.setdefault(name, []).append((labels, metric))
+
+        for name, series in by_name.items():
+            kind, help_text = help_texts[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series:
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), metric.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {metric.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Registro compartido por todos los módulos del proceso
+REGISTRY = MetricsRegistry()
+span = REGISTRY.span
+
+# Contadores comunes a ambos procesadores
+DECISIONS = REGISTRY.counter("dosificacion_decisiones_total", "Dosificaciones escritas en el PLC")
+MODBUS_ERRORS = REGISTRY.counter("dosificacion_errores_modbus_total", "Errores de comunicación Modbus en el lazo")
+BIGDATA_DROPPED = REGISTRY.counter("dosificacion_bigdata_descartados_total",
+                                   "Registros de BigData descartados por cola llena")
+
+
+logger = logging.getLogger(__name__)
+
+
+def start_metrics_server(port=9108, address="127.0.0.1", registry=REGISTRY):
+    """Sirve /metrics en un hilo daemon y devuelve el servidor HTTP (None si el puerto no está libre)"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((address, port), MetricsHandler)
+    except OSError as e:
+        # Otro procesador del mismo equipo ya usa el puerto: el lazo sigue sin /metrics
+        logger.warning("No se pudo abrir /metrics en %s:%s, se continúa sin métricas: %s", address, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def stop_on_sigterm():
+    """Trata SIGTERM como Ctrl-C (KeyboardInterrupt) para que los finally vacíen BigData antes de salir"""
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+
+def configure_logging(level=None):
+    """Configura el logger raíz; el nivel sale de LOG_LEVEL (INFO por defecto)"""
+    logging.basicConfig(
+        level=(level or os.environ.get("LOG_LEVEL", "INFO")).upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+
+from modbus_tk import modbus_tcp
+from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+
+
+class ConnectionUnavailableError(Exception):
+    """La conexión está en espera de reintento (backoff) tras fallos consecutivos"""
+
+
+class ManagedConnection:
+    """TcpMaster con reconexión automática y backoff exponencial con jitter.
+
+    Tras el primer fallo de una conexión sana se reconecta y reintenta en el
+    acto (una caída breve se recupera en milisegundos). Si sigue fallando, los
+    siguientes intentos se espacian entre backoff_base y backoff_max segundos.
+    Expone execute() con la misma firma que modbus_tk, así que sustituye al
+    TcpMaster sin cambiar el código que lo usa.
+    """
+
+    def __init__(self, host, port, timeout=2.0, backoff_base=0.05, backoff_max=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failures = 0
+        self.reconnections = 0
+        self._master = None
+        self._next_attempt = 0.0
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        master = modbus_tcp.TcpMaster(host=self.host, port=self.port, timeout_in_sec=self.timeout)
+        master.open()
+        if self.failures:
+            self.reconnections += 1
+        self._master = master
+
+    def _close_master(self):
+        if self._master is not None:
+            try:
+                self._master.close()
+            except Exception:
+                pass
+            self._master = None
+
+    def _on_failure(self):
+        self._close_master()
+        self.failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+        self._next_attempt = time.monotonic() + random.uniform(delay / 2, delay)
+
+    def time_until_retry(self):
+        """Segundos que faltan para poder reintentar la conexión (0 si ya se puede)"""
+        return max(self._next_attempt - time.monotonic(), 0.0)
+
+    def open(self):
+        with self._lock:
+            if self._master is not None:
+                return
+            if self.time_until_retry() > 0:
+                raise ConnectionUnavailableError(
+                    f"{self.host}:{self.port} en espera de reintento ({self.time_until_retry():.2f} s)"
+                )
+            try:
+                self._connect()
+            except OSError:
+                self._on_failure()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._close_master()
+
+    def execute(self, *args, **kwargs):
+        with self._lock:
+            for attempt in range(2):
+                self.open()
+                try:
+                    result = self._master.execute(*args, **kwargs)
+                    self.failures = 0
+                    return result
+                except ModbusError:
+                    # Respuesta de excepción del PLC: la conexión está bien
+                    raise
+                except (OSError, ModbusInvalidResponseError):
+                    first_failure = self.failures == 0
+                    self._on_failure()
+                    if attempt or not first_failure:
+                        raise
+                    # Socket caído en una conexión que estaba sana: reconectar ya, sin esperar
+                    self._next_attempt = 0.0
+
+    def is_connected(self):
+        return self._master is not None
+
+
+class ConnectionPool:
+    """Una ManagedConnection por (host, puerto), compartida por todos los procesadores del proceso"""
+
+    def __init__(self):
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port, **options):
+        with self._lock:
+            connection = self._connections.get((host, port))
+            if connection is None:
+                connection = ManagedConnection(host, port, **options)
+                self._connections[(host, port)] = connection
+            return connection
+
+    def close_all(self):
+        with self._lock:
+            for connection in self._connections.values():
+                connection.close()
+            self._connections.clear()
+
+
+_default_pool = ConnectionPool()
+
+
+def get_connection(host, port, **options):
+    """Conexión gestionada compartida del pool por defecto"""
+    return _default_pool.get(host, port, **options)
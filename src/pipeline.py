@@ -0,0 +1,405 @@
+import logging
+import time
+
+import numpy as np
+
+from band_index import BAND_INDEX
+from bigdata_sink import make_record
+from dosing_table import DIFFICULTIES
+from interpolation import InterpolatedTables
+from metrics import BIGDATA_DROPPED, DECISIONS, MODBUS_ERRORS, span
+from modbus_pool import ConnectionUnavailableError
+from register_map import DEFAULT_REGISTER_MAP, RegisterMap, Tag
+from ring_buffer import SampleRingBuffer
+from scheduler import AdaptiveScheduler
+from setpoints import SetpointWriter
+
+logger = logging.getLogger(__name__)
+
+# Registros de consigna de cada modo: [dosificación x100, 1] en 4-5 (PLCClient) y entero en 300 (PLCExcelDataProcessor)
+CLIENT_DOSING_REGISTER = 4
+EXCEL_DOSING_REGISTER = 300
+
+
+# --- Adquisición ---------------------------------------------------------------------------------
+
+class RegisterAcquirer:
+    """Lee las variables del mapa de registros en bloques (una transacción por bloque)"""
+
+    def __init__(self, register_map=DEFAULT_REGISTER_MAP, unit_id=1):
+        self.register_map = register_map
+        self.unit_id = unit_id
+
+    def acquire(self, master):
+        return self.register_map.read(master, self.unit_id)
+
+    async def acquire_async(self, master):
+        return await self.register_map.read_async(master, self.unit_id)
+
+
+# --- Filtro / promedio ---------------------------------------------------------------------------
+
+class BatchEndFilter:
+    """Acumula muestras mientras el PLC envía (flag=1) y entrega la última al bajar el flag
+
+    La dificultad es la del PLC salvo que se fije con 'difficulty'.
+    """
+
+    def __init__(self, capacity=256, difficulty=None):
+        # Ventana circular de muestras (O(1) por muestra, memoria acotada aunque el PLC no baje el flag)
+        self.samples = SampleRingBuffer(capacity=capacity)
+        self.difficulty = difficulty
+        self.active = False
+
+    def update(self, snapshot):
+        """Devuelve la muestra a dosificar (turbidez, promedio, dificultad) o None si aún no toca"""
+        if snapshot.flag == 1:
+            self.active = True
+            self.samples.append(timestamp=snapshot.timestamp, turbidez=snapshot.turbidez,
+                                promedio=snapshot.promedio, dificultad=snapshot.dificultad, flag=snapshot.flag)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Datos recibidos: %s", [snapshot.turbidez, snapshot.promedio,
+                                                     DIFFICULTIES.get(snapshot.dificultad, "Desconocido"),
+                                                     snapshot.flag])
+            return None
+
+        self.active = bool(self.samples)
+        if not self.samples:
+            return None
+
+        logger.info("PLC dejó de enviar. Preparando dosificación...")
+        ultimo = self.samples.last()
+        return {
+            "turbidez": int(ultimo["turbidez"]),  # Los registros del PLC son enteros
+            "promedio": ultimo["promedio"],
+            "dificultad": self.difficulty or int(ultimo["dificultad"]),
+        }
+
+    def commit(self):
+        """Descarta las muestras ya dosificadas (o que no se pudieron dosificar)"""
+        self.samples.clear()
+
+
+class WeightedAverageFilter:
+    """Promedio ponderado de las últimas lecturas de turbidez, como mucho una vez cada min_period segundos
+
+    La muestra entregada combina la última lectura (fila de la tabla) con el
+    promedio ponderado (columna). La dificultad es 'difficulty' si se fija y, si
+    no, la última leída del PLC (el mapa de registros debe incluir 'dificultad').
+    """
+
+    def __init__(self, difficulty=None, window=10, num_readings=2, min_period=120.0, clock=time.monotonic):
+        self.difficulty = difficulty
+        self.num_readings = num_readings
+        self.min_period = min_period
+        self.samples = SampleRingBuffer(capacity=window, fields=("timestamp", "turbidez"))
+        self.active = False
+        self._clock = clock
+        self._last_average = clock()
+        self._last_value = None
+        self._plc_difficulty = None
+
+    def update(self, snapshot):
+        turbidez = snapshot.turbidez
+        if "dificultad" in snapshot.values:
+            self._plc_difficulty = snapshot.values["dificultad"]
+        self.active = turbidez != self._last_value
+        self._last_value = turbidez
+
+        self.samples.append(timestamp=snapshot.timestamp, turbidez=turbidez)  # La ventana descarta sola el valor más antiguo
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Valores leídos por el PLC: %s", self.samples.column("turbidez").tolist())
+
+        if self._clock() - self._last_average < self.min_period:
+            return None
+
+        # Promedio ponderado de las últimas 'num_readings' lecturas (pesos precalculados en la ventana)
+        weighted_avg = self.samples.weighted_average("turbidez", self.num_readings)
+        if weighted_avg is None:
+            return None
+        logger.info("Promedio ponderado calculado: %s", weighted_avg)
+
+        self._last_average = self._clock()
+        return {"turbidez": turbidez, "promedio": int(weighted_avg), "dificultad": self.current_difficulty}
+
+    @property
+    def current_difficulty(self):
+        """Dificultad fija o, si no, la última leída del PLC"""
+        return self.difficulty or self._plc_difficulty
+
+    def commit(self):
+        # Tras cada cálculo la ventana vuelve a su estado inicial
+        self.samples.clear()
+
+
+# --- Consulta de la tabla ------------------------------------------------------------------------
+
+class TableLookup:
+    """Dosificación de la tabla por (dificultad, banda de turbidez, banda de promedio)"""
+
+    def __init__(self, dosing_table):
+        self.dosing_table = dosing_table
+
+    def lookup(self, turbidez, promedio, dificultad):
+        """Devuelve (dosificación, rango de turbidez, hoja) o (None, None, hoja) si no hay valor"""
+        sheet_name = DIFFICULTIES.get(dificultad, dificultad)
+        if sheet_name not in self.dosing_table.sheet_names:
+            logger.warning("Dificultad no válida: %s", dificultad)
+            return None, None, None
+
+        # Bandas precalculadas: una búsqueda binaria por valor en lugar de recorrer los rangos
+        turbidity_band = BAND_INDEX.classify(turbidez)
+        average_band = BAND_INDEX.classify(promedio)
+        if average_band < 0 or turbidity_band < 0:
+            logger.warning("No se encontró un rango válido para turbidez (%s) o promedio (%s).", turbidez, promedio)
+            return None, None, sheet_name
+
+        value = self.dosing_table.lookup(sheet_name, turbidity_band, average_band)
+        logger.debug("Hoja %s, fila %s, columna %s: %s", sheet_name, BAND_INDEX.row_number(turbidity_band),
+                     BAND_INDEX.column_letter(average_band), value)
+        return value, BAND_INDEX.label(turbidity_band), sheet_name
+
+
+class InterpolatedLookup(TableLookup):
+    """Como TableLookup pero interpolando entre los puntos medios de las bandas (sin saltos entre celdas)
+
+    Los valores fuera de la tabla se recortan al borde en lugar de descartarse;
+    el rango guardado en BigData sigue siendo la banda de turbidez (None si cae fuera).
+    """
+
+    def __init__(self, dosing_table):
+        super().__init__(dosing_table)
+        self.interpolated = InterpolatedTables(dosing_table)
+
+    def lookup(self, turbidez, promedio, dificultad):
+        sheet_name = DIFFICULTIES.get(dificultad, dificultad)
+        value = self.interpolated.evaluate(sheet_name, turbidez, promedio)
+        if value is None:
+            logger.warning("Dificultad no válida: %s", dificultad)
+            return None, None, None
+        if np.isnan(value):
+            logger.warning("Sin valor en la tabla para turbidez (%s) y promedio (%s).", turbidez, promedio)
+            return None, None, sheet_name
+
+        logger.debug("Hoja %s, turbidez %s, promedio %s: %s (interpolado)", sheet_name, turbidez, promedio, value)
+        return value, BAND_INDEX.label(BAND_INDEX.classify(turbidez)), sheet_name
+
+
+LOOKUP_MODES = {"discreto": TableLookup, "interpolado": InterpolatedLookup}
+
+
+# --- Actuación -----------------------------------------------------------------------------------
+
+class RegisterActuator:
+    """Escribe la consigna en el PLC: [int(dosificación * scale), *trailer] a partir de 'address'
+
+    Las escrituras pasan por un SetpointWriter: no se reenvía una consigna que el
+    PLC ya tiene (los registros del trailer, el flag de handshake, se escriben
+    siempre), lo pendiente tras un fallo se agrupa en una sola transacción y,
+    con verify=True, se relee lo escrito.
+    """
+
+    def __init__(self, address, scale=1, trailer=(), unit_id=1, verify=False, refresh_interval=60.0):
+        self.address = address
+        self.scale = scale
+        self.trailer = tuple(trailer)
+        self.unit_id = unit_id
+        handshake = range(address + 1, address + 1 + len(self.trailer))
+        self.setpoints = SetpointWriter(unit_id=unit_id, verify=verify, refresh_interval=refresh_interval,
+                                        volatile=handshake)
+
+    def encode(self, dosificacion):
+        return [int(float(dosificacion) * self.scale), *self.trailer]
+
+    def actuate(self, master, decision):
+        """Escribe la consigna; devuelve True si se escribió su registro (False si el PLC ya la tenía)"""
+        self.setpoints.stage(decision["registro"], decision["valores"])
+        return self._setpoint_written(decision, self.setpoints.flush(master))
+
+    async def actuate_async(self, master, decision):
+        self.setpoints.stage(decision["registro"], decision["valores"])
+        return self._setpoint_written(decision, await self.setpoints.flush_async(master))
+
+    @staticmethod
+    def _setpoint_written(decision, blocks):
+        # Un bloque que solo lleva el handshake o registros de relleno no cuenta como dosificación enviada
+        address = decision["registro"]
+        return any(start <= address < start + len(values) for start, values in blocks)
+
+    def reset(self):
+        """Tras un error de comunicación no se da por buena ninguna consigna anterior"""
+        self.setpoints.invalidate()
+
+
+def log_actuation(decision, written, prefix=""):
+    """Registra y cuenta una dosificación solo si se escribió su registro de consigna en el PLC"""
+    if written:
+        DECISIONS.inc()
+        logger.info("%sDosificación enviada al PLC: %s", prefix, decision["valores"][0])
+    else:
+        logger.debug("%sEl PLC ya tiene la dosificación %s, no se reenvía", prefix, decision["valores"][0])
+
+
+# --- Persistencia --------------------------------------------------------------------------------
+
+class BigDataPersister:
+    """Encola cada dosificación escrita para el historial BigData (escritor en segundo plano)"""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def persist(self, decision):
+        try:
+            record = make_record(decision["promedio"], decision["dificultad"], decision["turbidez"],
+                                 decision["dosificacion"], decision["rango"])
+            if self.writer.submit(record):
+                logger.debug("Datos encolados para el historial 'BigData'.")
+            else:
+                BIGDATA_DROPPED.inc()
+                logger.warning("Cola de BigData llena, registros descartados: %s", self.writer.dropped)
+        except Exception as e:
+            logger.error("Error al guardar los datos en BigData: %s", e)
+
+
+# --- Lazo ----------------------------------------------------------------------------------------
+
+class DosingPipeline:
+    """Lazo de dosificación por etapas: adquisición -> filtro -> tabla -> actuación -> persistencia.
+
+    Cada etapa es un objeto intercambiable; los dos procesadores históricos son
+    solo configuraciones distintas (ver build_client_pipeline y
+    build_excel_pipeline), así que cachés, lotes y métricas son comunes a todos.
+    """
+
+    def __init__(self, master, acquirer, sample_filter, lookup, actuator, persister, scheduler=None):
+        self.master = master
+        self.acquirer = acquirer
+        self.sample_filter = sample_filter
+        self.lookup = lookup
+        self.actuator = actuator
+        self.persister = persister
+        self.scheduler = scheduler or AdaptiveScheduler()
+
+    def acquire(self):
+        with span("lectura_modbus"):
+            return self.acquirer.acquire(self.master)
+
+    def decide(self, snapshot):
+        """Pasa el snapshot por el filtro y la tabla; devuelve la decisión a escribir o None"""
+        with span("decision"):
+            sample = self.sample_filter.update(snapshot)
+            if sample is None:
+                return None
+
+            decision = self.decide_sample(sample)
+            if decision is None:
+                self.sample_filter.commit()
+            # Si hay decisión el filtro se limpia en confirm(), tras escribir en el PLC
+            return decision
+
+    def decide_sample(self, sample):
+        """Decisión para una muestra ya filtrada (turbidez, promedio, dificultad), sin tocar el filtro"""
+        with span("consulta_tabla"):
+            dosificacion, rango, sheet_name = self.lookup.lookup(
+                sample["turbidez"], sample["promedio"], sample["dificultad"])
+        if dosificacion is None:
+            logger.warning("No se pudo calcular una dosificación válida desde la tabla.")
+            return None
+
+        return {
+            "registro": self.actuator.address,
+            "valores": self.actuator.encode(dosificacion),
+            "promedio": sample["promedio"],
+            "dificultad": sheet_name,
+            "turbidez": sample["turbidez"],
+            "dosificacion": dosificacion,
+            "rango": rango,
+        }
+
+    def actuate(self, decision):
+        with span("escritura_plc"):
+            written = self.actuator.actuate(self.master, decision)
+        log_actuation(decision, written)
+        return written
+
+    def confirm(self, decision):
+        """Guarda en BigData una dosificación ya escrita en el PLC y limpia el filtro"""
+        with span("persistencia"):
+            self.persister.persist(decision)
+        self.sample_filter.commit()
+
+    def step(self, snapshot=None):
+        """Un ciclo completo; la consigna se escribe antes de persistir para que BigData nunca la retrase"""
+        with span("ciclo"):
+            if snapshot is None:
+                snapshot = self.acquire()
+            decision = self.decide(snapshot)
+            if decision is not None:
+                self.actuate(decision)
+                self.confirm(decision)
+        return decision
+
+    def run(self):
+        while True:
+            try:
+                self.step()
+                # Sondeo rápido mientras hay actividad, más lento en reposo
+                self.scheduler.update(active=self.sample_filter.active)
+                self.scheduler.wait()
+            except ConnectionUnavailableError as e:
+                # Conexión en backoff: no se ha enviado nada, el fallo ya se contó al producirse
+                logger.debug("%s", e)
+            except Exception as e:
+                MODBUS_ERRORS.inc()
+                logger.error("Error en la comunicación Modbus: %s", e)
+                self.actuator.reset()
+            else:
+                continue
+
+            # La conexión ya se reabrió si fue una caída puntual; si no, esperar todo el backoff pendiente
+            retry = self.master.time_until_retry() if hasattr(self.master, "time_until_retry") else 0
+            time.sleep(max(retry, 0.05))
+            self.scheduler.reset()
+
+
+def build_client_pipeline(master, dosing_table, writer, register_map=None, unit_id=1,
+                          min_interval=0.2, max_interval=2.0, sample_capacity=256, difficulty=None,
+                          lookup_mode="discreto", verify_writes=False, setpoint_refresh=60.0):
+    """Modo PLCClient: registros 0-3, dosificación al bajar el flag, [dosificación x100, 1] en 4-5"""
+    return DosingPipeline(
+        master,
+        RegisterAcquirer(register_map or DEFAULT_REGISTER_MAP, unit_id),
+        BatchEndFilter(capacity=sample_capacity, difficulty=difficulty),
+        LOOKUP_MODES[lookup_mode](dosing_table),
+        RegisterActuator(CLIENT_DOSING_REGISTER, scale=100, trailer=(1,), unit_id=unit_id,
+                         verify=verify_writes, refresh_interval=setpoint_refresh),
+        BigDataPersister(writer),
+        AdaptiveScheduler(min_interval=min_interval, max_interval=max_interval),
+    )
+
+
+def build_excel_pipeline(master, dosing_table, writer, difficulty=None, row_register=0, difficulty_register=2,
+                         register_map=None, unit_id=1, window=10, num_readings=2, min_period=120.0,
+                         min_interval=5, max_interval=5, lookup_mode="discreto", verify_writes=False,
+                         setpoint_refresh=60.0, register_gap=0):
+    """Modo PLCExcelDataProcessor: turbidez en row_register, promedio ponderado y valor entero en 300
+
+    Sin dificultad fija se lee también del PLC (difficulty_register), en la misma
+    lectura si register_gap alcanza a cubrir el hueco entre ambos registros.
+    """
+    if register_map is None:
+        tags = [Tag("turbidez", row_register)]
+        if difficulty is None:
+            tags.append(Tag("dificultad", difficulty_register))
+        register_map = RegisterMap(tags, max_gap=register_gap)
+
+    return DosingPipeline(
+        master,
+        RegisterAcquirer(register_map, unit_id),
+        WeightedAverageFilter(difficulty, window=window, num_readings=num_readings, min_period=min_period),
+        LOOKUP_MODES[lookup_mode](dosing_table),
+        RegisterActuator(EXCEL_DOSING_REGISTER, unit_id=unit_id, verify=verify_writes,
+                         refresh_interval=setpoint_refresh),
+        BigDataPersister(writer),
+        AdaptiveScheduler(min_interval=min_interval, max_interval=max_interval),
+    )
@@ -1,171 +1,83 @@
-import time
-import pandas as pd
-from modbus_tk import modbus_tcp
-import modbus_tk.defines as cst
-from datetime import datetime
-from openpyxl import load_workbook
-import os
+import logging
+from bigdata_sink import BigDataExporter, open_default_sink
+from bigdata_writer import BackgroundBigDataWriter
+from config import load_config
+from dosing_table import DIFFICULTIES, get_dosing_table
+from metrics import configure_logging, start_metrics_server, stop_on_sigterm
+from modbus_pool import get_connection
+from pipeline import CLIENT_DOSING_REGISTER, build_client_pipeline
+
+logger = logging.getLogger(__name__)
 
 class PLCClient:
-    def __init__(self, ip, port, excel_path):
-        self.master = modbus_tcp.TcpMaster(host=ip, port=port)
-        self.master.set_timeout(2)
+    # Registro donde se escribe [dosificación x100, 1]
+    DOSING_REGISTER = CLIENT_DOSING_REGISTER
+
+    def __init__(self, ip, port, excel_path, bigdata_sink=None, export_interval=300, register_map=None,
+                 unit_id=1, bigdata_writer=None, min_interval=0.2, max_interval=2.0,
+                 sample_capacity=256, difficulty=None, dosing_table=None, lookup_mode="discreto",
+                 verify_writes=False, setpoint_refresh=60.0):
+        # Conexión compartida del pool con reconexión automática y backoff exponencial
+        self.master = get_connection(ip, port, timeout=2)
+        self.unit_id = unit_id
         self.excel_path = excel_path
-        self.lista_datos = []
-        self.difficulties = {
-            1: "Muy Fácil",
-            2: "Fácil",
-            3: "Medio",
-            4: "Difícil",
-            5: "Muy Difícil"
-        }
-
-    def save_to_bigdata(self, promedio, dificultad, valor, dosificacion, rango):
-        try:
-            sheet_name = "BigData"
-            new_row = {
-                "Promedio": promedio,
-                "Dificultad": dificultad,
-                "Valor": valor,
-                "Dosificación": dosificacion,
-                "Fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "Rango": rango
-            }
-
-            # Cargar archivo Excel
-            if os.path.exists(self.excel_path):
-                with pd.ExcelFile(self.excel_path) as xls:
-                    # Si existe BigData, cargarla y agregar nueva fila
-                    if sheet_name in xls.sheet_names:
-                        df_existing = pd.read_excel(self.excel_path, sheet_name=sheet_name)
-                        df_final = pd.concat([df_existing, pd.DataFrame([new_row])], ignore_index=True)
-                    else:
-                        df_final = pd.DataFrame([new_row])
-            else:
-                df_final = pd.DataFrame([new_row])
-
-            # Guardar usando openpyxl sin afectar otras hojas
-            with pd.ExcelWriter(self.excel_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-                df_final.to_excel(writer, sheet_name=sheet_name, index=False)
-
-            print("✅ Datos guardados correctamente en la hoja 'BigData'.")
-
-        except Exception as e:
-            print(f"❌ Error al guardar los datos en Excel: {e}")
-
-
-    def read_excel_value(self, sheet_name, column, row):
-        try:
-            df = pd.read_excel(self.excel_path, sheet_name=sheet_name)
-            column_index = ord(column.upper()) - ord('A')
-            value = df.iloc[row - 1, column_index]
-
-            print(f"Leyendo hoja: '{sheet_name}', columna: '{column}' (índice {column_index}), fila: {row}")
-            print(f"Valor encontrado en {column}{row}: {value}")
-
-            if isinstance(value, (float, int)):
-                return float(value)
-            else:
-                return None
-        except Exception as e:
-            print(f"Error al leer el archivo Excel: {e}")
-            return None
+        self.difficulties = DIFFICULTIES
+        # Tablas de dosificación precargadas (se recargan solo si cambian las hojas)
+        self.dosing_table = dosing_table or get_dosing_table(excel_path)
+        # Historial append-only y exportación periódica a la hoja 'BigData'
+        self.bigdata_sink = bigdata_sink or open_default_sink(excel_path)
+        self.bigdata_exporter = BigDataExporter(self.bigdata_sink, excel_path, interval=export_interval)
+        # La persistencia va por una cola con hilo propio para no frenar la escritura al PLC
+        self.bigdata_writer = bigdata_writer or BackgroundBigDataWriter(self.bigdata_sink)
+
+        # Lazo por etapas común a todos los procesadores, configurado en modo PLCClient
+        self.pipeline = build_client_pipeline(self.master, self.dosing_table, self.bigdata_writer,
+                                              register_map=register_map, unit_id=unit_id,
+                                              min_interval=min_interval, max_interval=max_interval,
+                                              sample_capacity=sample_capacity,
+                                              difficulty=DIFFICULTIES.get(difficulty, difficulty),
+                                              lookup_mode=lookup_mode, verify_writes=verify_writes,
+                                              setpoint_refresh=setpoint_refresh)
+        self.register_map = self.pipeline.acquirer.register_map
+        self.scheduler = self.pipeline.scheduler
+        self.lista_datos = self.pipeline.sample_filter.samples
+
+    @classmethod
+    def from_config(cls, config):
+        """Crea el cliente a partir de un ProcessorConfig (ver config.load_config)"""
+        return cls(ip=config.ip, port=config.port, excel_path=config.excel_path,
+                   export_interval=config.export_interval, register_map=config.register_map(),
+                   unit_id=config.unit_id, min_interval=config.min_interval, max_interval=config.max_interval,
+                   difficulty=config.difficulty, lookup_mode=config.lookup,
+                   verify_writes=config.verify_writes, setpoint_refresh=config.setpoint_refresh)
 
     def calcular_dosificacion_desde_excel(self, turbidez, promedio, dificultad):
-        difficulty_sheet = self.difficulties.get(dificultad)
-        if not difficulty_sheet:
-            print(f"Dificultad no válida: {dificultad}")
-            return None, None
-            
-        print(f"DEBUG: Hoja de dificultad seleccionada: {difficulty_sheet}")
-        print(f"DEBUG: Valores recibidos - Promedio: {promedio}, Turbidez: {turbidez}")
-
-        column_ranges = [(1, 15), (16, 25), (26, 50), (51, 75), (76, 100), (101, 125), (126, 150),
-                         (151, 175), (176, 200), (201, 225), (226, 250), (251, 275), (276, 300),
-                         (301, 350), (351, 400), (401, 450), (451, 500), (501, 550), (551, 600),
-                         (601, 650), (651, 700), (701, 750), (751, 800), (801, 850), (851, 900),
-                         (901, 950), (951, 1000)]
-
-        column = None
-        for idx, (low, high) in enumerate(column_ranges):
-            if low <= promedio <= high:
-                column = chr(ord('C') + idx)
-                break
-
-        row_number = None
-        rango_turbidez = None
-        for idx, (low, high) in enumerate(column_ranges):
-            if low <= turbidez <= high:
-                row_number = idx + 4
-                rango_turbidez = f"{low}-{high}"
-                break
-
-        if column is None or row_number is None:
-            print("No se encontró un rango válido para turbidez o promedio.")
-            return None, None
-
-        valor = self.read_excel_value(difficulty_sheet, column, row_number)
-        return valor, rango_turbidez
-
-
+        dosificacion, rango, _ = self.pipeline.lookup.lookup(turbidez, promedio, dificultad)
+        return dosificacion, rango
 
     def ejecutar(self):
-        while True:
-            try:
-                registro_estado = self.master.execute(1, cst.READ_HOLDING_REGISTERS, 3, 1)[0]
-
-                if registro_estado == 1:
-                    print("PLC está enviando datos...")
-                    turbidez = self.master.execute(1, cst.READ_HOLDING_REGISTERS, 0, 1)[0]
-                    promedio1 = self.master.execute(1, cst.READ_HOLDING_REGISTERS, 1, 1)[0]
-                    promedio = promedio1/1000
-                    print(f"el promedio leido es ------------- {promedio}")
-                    dificultad = self.master.execute(1, cst.READ_HOLDING_REGISTERS, 2, 1)[0]
-                    flag = self.master.execute(1, cst.READ_HOLDING_REGISTERS, 3, 1)[0]
-
-                    if dificultad in self.difficulties:
-                        dificultad_texto = self.difficulties[dificultad]
-                    else:
-                        dificultad_texto = "Desconocido"
-
-                    self.lista_datos.append([turbidez, promedio, dificultad_texto, flag])
-                    print(f"Datos recibidos: {self.lista_datos[-1]}")
-                    time.sleep(2)
-
-                else:
-                    print("PLC dejó de enviar. Preparando dosificación...")
-
-                    if self.lista_datos:
-                        ultimo = self.lista_datos[-1]
-                        turbidez_final = ultimo[0]
-                        promedio_final = ultimo[1]
-                        dificultadGuardar = ultimo[2]
-                        dificultad_final = list(self.difficulties.keys())[list(self.difficulties.values()).index(ultimo[2])]
-
-                        dosificacion, rango = self.calcular_dosificacion_desde_excel(
-                            turbidez=turbidez_final,
-                            promedio=promedio_final,
-                            dificultad=dificultad_final
-                        )
-
-                        if dosificacion is not None:
-                            self.save_to_bigdata(promedio_final, dificultadGuardar, turbidez_final, dosificacion, rango)
-                            dosificacion_entera = int(float(dosificacion) * 100)
-                            print(f"Enviando dosificación al PLC: {dosificacion_entera}")
-                            self.master.execute(1, cst.WRITE_MULTIPLE_REGISTERS, 4, output_value=[dosificacion_entera, 1])
-                        else:
-                            print("No se pudo calcular una dosificación válida desde Excel.")
-
-
-                    self.lista_datos.clear()
-                    print("Lista de datos limpiada. Esperando 2 segundos para volver a leer...")
-                    time.sleep(2)
-
-            except Exception as e:
-                print(f"Error en la comunicación Modbus: {e}")
-                time.sleep(2)
-
-# Ejemplo de uso:
+        self.bigdata_writer.start()
+        self.bigdata_exporter.start()
+        try:
+            self.pipeline.run()
+        finally:
+            # Primero se vacía la cola de BigData y luego la exportación final la incluye
+            self.bigdata_writer.stop()
+            self.bigdata_exporter.stop()
+
+def main(argv=None):
+    # Configuración: archivo JSON, variables DOSIFICACION_* y argumentos
+    config = load_config(argv, mode="client")
+    configure_logging(config.log_level)
+    stop_on_sigterm()
+    if config.metrics_port:
+        start_metrics_server(port=config.metrics_port)  # p. ej. --metrics-port 9108: http://127.0.0.1:9108/metrics
+    try:
+        PLCClient.from_config(config).ejecutar()
+    except KeyboardInterrupt:
+        logger.info("Procesador detenido.")
+
+
+# Ejemplo de uso: python src/plc_procesor.py --ip 127.0.0.1 --port 502
 if __name__ == "__main__":
-    cliente = PLCClient(ip="127.0.0.1", port=502, excel_path="data/datos.xlsx")
-    cliente.ejecutar()
+    main()
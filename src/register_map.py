@@ -0,0 +1,97 @@
+import time
+from dataclasses import dataclass, field
+
+import modbus_tk.defines as cst
+
+# Máximo de registros que admite una lectura Modbus (READ_HOLDING_REGISTERS)
+MAX_BLOCK_SIZE = 125
+
+
+@dataclass(frozen=True)
+class Tag:
+    """Variable del PLC: nombre, dirección del registro y escala (valor = crudo / scale)"""
+    name: str
+    address: int
+    scale: float = 1
+    signed: bool = False
+
+    def decode(self, raw):
+        if self.signed and raw >= 0x8000:
+            raw -= 0x10000
+        return raw / self.scale if self.scale != 1 else raw
+
+
+@dataclass
+class PLCSnapshot:
+    """Valores de todas las variables leídos en la misma transacción"""
+    values: dict
+    timestamp: float = field(default_factory=time.time)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["values"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+
+class RegisterMap:
+    """Mapa de registros con nombre que agrupa direcciones contiguas en lecturas de bloque
+
+    Con max_gap > 0 dos variables separadas por hasta max_gap registros sin
+    usar van en el mismo bloque (una transacción menos a cambio de leer
+    registros de más). Por defecto solo se agrupan direcciones contiguas: en
+    un PLC con huecos en su mapa leer un registro inexistente hace fallar el
+    bloque entero.
+    """
+
+    def __init__(self, tags, max_block_size=MAX_BLOCK_SIZE, max_gap=0):
+        self.tags = sorted(tags, key=lambda tag: tag.address)
+        self.max_block_size = max_block_size
+        self.max_gap = max_gap
+        self.blocks = self._build_blocks()
+
+    def _build_blocks(self):
+        """Agrupa las variables en bloques (inicio, cantidad, [tags]) de direcciones cercanas"""
+        blocks = []
+        for tag in self.tags:
+            if blocks:
+                start, count, block_tags = blocks[-1]
+                end = start + count
+                if tag.address <= end + self.max_gap and tag.address - start < self.max_block_size:
+                    blocks[-1] = (start, max(count, tag.address - start + 1), block_tags + [tag])
+                    continue
+            blocks.append((tag.address, 1, [tag]))
+        return blocks
+
+    @staticmethod
+    def _decode_block(values, start, block_tags, registers):
+        for tag in block_tags:
+            values[tag.name] = tag.decode(registers[tag.address - start])
+
+    def read(self, master, slave=1):
+        """Lee todas las variables con una transacción por bloque y devuelve un PLCSnapshot"""
+        values = {}
+        for start, count, block_tags in self.blocks:
+            registers = master.execute(slave, cst.READ_HOLDING_REGISTERS, start, count)
+            self._decode_block(values, start, block_tags, registers)
+        return PLCSnapshot(values)
+
+    async def read_async(self, master, slave=1):
+        """Igual que read() pero con un maestro asyncio (AsyncTcpMaster)"""
+        values = {}
+        for start, count, block_tags in self.blocks:
+            registers = await master.execute(slave, cst.READ_HOLDING_REGISTERS, start, count)
+            self._decode_block(values, start, block_tags, registers)
+        return PLCSnapshot(values)
+
+
+# Mapa de registros de las estaciones de dosificación (registros 0-3 en una sola lectura)
+DEFAULT_REGISTER_MAP = RegisterMap([
+    Tag("turbidez", 0),
+    Tag("promedio", 1, scale=1000),
+    Tag("dificultad", 2),
+    Tag("flag", 3),
+])
@@ -0,0 +1,129 @@
+import argparse
+
+import numpy as np
+
+from band_index import BAND_INDEX, FIRST_COLUMN_INDEX, FIRST_ROW_INDEX
+from bigdata_sink import make_sink
+from dosing_table import DIFFICULTIES, DosingTable
+import table_cache
+
+
+def stack_tables(tables, sheet_names=None):
+    """Apila las hojas de dificultad en un array (hoja, fila, columna), rellenando con NaN si difieren en tamaño"""
+    sheet_names = list(sheet_names or DIFFICULTIES.values())
+    return table_cache.stack_tables(tables, sheet_names), sheet_names
+
+
+def lookup_batch(stacked, sheet_indices, turbidez, promedio):
+    """Dosificación vectorizada para arrays de (hoja, turbidez, promedio); NaN donde no hay rango o hoja"""
+    turbidity_bands = BAND_INDEX.classify(turbidez)
+    average_bands = BAND_INDEX.classify(promedio)
+
+    rows = turbidity_bands + FIRST_ROW_INDEX
+    columns = average_bands + FIRST_COLUMN_INDEX
+    valid = (
+        (sheet_indices >= 0) & (turbidity_bands >= 0) & (average_bands >= 0)
+        & (rows < stacked.shape[1]) & (columns < stacked.shape[2])
+    )
+
+    result = np.full(len(turbidez), np.nan)
+    result[valid] = stacked[sheet_indices[valid], rows[valid], columns[valid]]
+    return result
+
+
+class WeightedMovingAverage:
+    """Promedio ponderado lineal (pesos 1..n) de la turbidez a lo largo de bloques consecutivos"""
+
+    def __init__(self, window):
+        self.window = window
+        self.weights = np.arange(1, window + 1, dtype=float)
+        self._tail = np.empty(0)
+
+    def apply(self, values):
+        series = np.concatenate([self._tail, values])
+        n = self.window
+
+        # Ventana completa: convolución con pesos n..1 (la muestra más reciente pesa n)
+        averages = np.convolve(series, self.weights[::-1])[:len(series)] / self.weights.sum()
+
+        # Solo al inicio del historial hay ventanas incompletas: pesos 1..k con las k muestras disponibles
+        if len(self._tail) < n - 1:
+            for j in range(min(n - 1, len(series))):
+                weights = np.arange(1, j + 2, dtype=float)
+                averages[j] = np.dot(series[:j + 1], weights) / weights.sum()
+
+        self._tail = series[len(series) - (n - 1):] if n > 1 else np.empty(0)
+        return averages[len(series) - len(values):]
+
+
+def replay(sink, tables, average_window=None, batch_size=50000, tolerance=1e-9):
+    """Recalcula la dosificación de todo el historial con otra tabla (y opcionalmente otra ventana de promedio)
+
+    Devuelve un resumen con el número de registros, los comparables, los que
+    cambian y las diferencias media/máxima, en total y por dificultad.
+    """
+    stacked, sheet_names = stack_tables(tables)
+    sheet_lookup = {name: i for i, name in enumerate(sheet_names)}
+    moving_average = WeightedMovingAverage(average_window) if average_window else None
+
+    summary = {"registros": 0, "comparables": 0, "cambios": 0, "suma_abs": 0.0, "max_abs": 0.0, "sin_rango": 0}
+    by_difficulty = {name: {"registros": 0, "cambios": 0, "suma_abs": 0.0} for name in sheet_names}
+
+    for batch in sink.iter_batches(batch_size):
+        turbidez = batch["Valor"]
+        promedio = moving_average.apply(turbidez) if moving_average else batch["Promedio"]
+        sheet_indices = np.array([sheet_lookup.get(name, -1) for name in batch["Dificultad"]], dtype=int)
+
+        recomputed = lookup_batch(stacked, sheet_indices, turbidez, promedio)
+        recorded = batch["Dosificación"]
+
+        comparable = np.isfinite(recomputed) & np.isfinite(recorded)
+        differences = np.abs(recomputed - recorded)
+        changed = comparable & (differences > tolerance)
+
+        summary["registros"] += len(recorded)
+        summary["comparables"] += int(comparable.sum())
+        summary["cambios"] += int(changed.sum())
+        summary["sin_rango"] += int(np.isnan(recomputed).sum())
+        if comparable.any():
+            summary["suma_abs"] += float(differences[comparable].sum())
+            summary["max_abs"] = max(summary["max_abs"], float(differences[comparable].max()))
+
+        for name, i in sheet_lookup.items():
+            mask = comparable & (sheet_indices == i)
+            stats = by_difficulty[name]
+            stats["registros"] += int(mask.sum())
+            stats["cambios"] += int((changed & mask).sum())
+            stats["suma_abs"] += float(differences[mask].sum())
+
+    summary["media_abs"] = summary["suma_abs"] / summary["comparables"] if summary["comparables"] else 0.0
+    for stats in by_difficulty.values():
+        stats["media_abs"] = stats["suma_abs"] / stats["registros"] if stats["registros"] else 0.0
+    summary["por_dificultad"] = by_difficulty
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce el historial de BigData con una tabla de dosificación candidata")
+    parser.add_argument("--historial", default="data/bigdata.sqlite3", help="Historial BigData (SQLite o directorio CSV)")
+    parser.add_argument("--tipo", choices=("sqlite", "csv"), default="sqlite")
+    parser.add_argument("--tabla", default="data/datos.xlsx", help="Libro con las hojas de dificultad candidatas")
+    parser.add_argument("--ventana", type=int, default=None,
+                        help="Recalcular el promedio con un promedio ponderado de N lecturas de turbidez")
+    parser.add_argument("--bloque", type=int, default=50000)
+    args = parser.parse_args()
+
+    sink = make_sink(args.tipo, args.historial)
+    summary = replay(sink, DosingTable(args.tabla).tables, average_window=args.ventana, batch_size=args.bloque)
+
+    print(f"Registros: {summary['registros']}, comparables: {summary['comparables']}, "
+          f"sin rango: {summary['sin_rango']}, con cambios: {summary['cambios']}")
+    print(f"Diferencia absoluta media: {summary['media_abs']:.4f}, máxima: {summary['max_abs']:.4f}")
+    for name, stats in summary["por_dificultad"].items():
+        print(f"  {name:<12} registros={stats['registros']:>8} cambios={stats['cambios']:>8} "
+              f"media_abs={stats['media_abs']:.4f}")
+
+
+# Ejemplo de uso: python src/replay.py --tabla data/datos_nuevos.xlsx --ventana 5
+if __name__ == "__main__":
+    main()
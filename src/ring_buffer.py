@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+# Campos de cada muestra del PLC (la dificultad se guarda como código 1-5)
+SAMPLE_FIELDS = ("timestamp", "turbidez", "promedio", "dificultad", "flag")
+
+
+class SampleRingBuffer:
+    """Ventana circular de muestras con capacidad fija respaldada por NumPy.
+
+    Cada muestra se escribe dos veces (en i y en i + capacity), de modo que las
+    últimas n muestras siempre forman un bloque contiguo: window() devuelve una
+    vista en orden cronológico sin copiar datos. append() es O(1).
+    """
+
+    def __init__(self, capacity, fields=SAMPLE_FIELDS):
+        if capacity <= 0:
+            raise ValueError("La capacidad debe ser mayor que cero")
+
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._columns = {name: i for i, name in enumerate(self.fields)}
+        self._data = np.full((2 * capacity, len(self.fields)), np.nan)
+        self._end = 0
+        self._size = 0
+        self._weights = {}
+
+    def __len__(self):
+        return self._size
+
+    def append(self, **values):
+        """Añade una muestra; los campos no indicados quedan como NaN y timestamp por defecto es ahora"""
+        if "timestamp" in self._columns and values.get("timestamp") is None:
+            values["timestamp"] = time.time()
+
+        row = self._data[self._end]
+        row[:] = np.nan
+        for name, value in values.items():
+            row[self._columns[name]] = value
+        self._data[self._end + self.capacity] = row
+
+        self._end = (self._end + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def clear(self):
+        self._size = 0
+
+    def window(self, n=None):
+        """Vista (sin copia) de las últimas n muestras, de la más antigua a la más reciente"""
+        n = self._size if n is None else min(n, self._size)
+        stop = self._end + self.capacity
+        return self._data[stop - n:stop]
+
+    def column(self, name, n=None):
+        """Vista de un campo en las últimas n muestras"""
+        return self.window(n)[:, self._columns[name]]
+
+    def last(self):
+        """Última muestra como diccionario, o None si la ventana está vacía"""
+        if not self._size:
+            return None
+        row = self._data[self._end + self.capacity - 1]
+        return {name: row[i].item() for name, i in self._columns.items()}
+
+    def weighted_average(self, name, n):
+        """Promedio ponderado lineal (pesos 1..n, más peso a lo reciente) con pesos precalculados"""
+        n = min(n, self._size)
+        if n == 0:
+            return None
+
+        cached = self._weights.get(n)
+        if cached is None:
+            weights = np.arange(1, n + 1, dtype=float)
+            cached = self._weights[n] = (weights, weights.sum())
+
+        weights, total = cached
+        return float(np.dot(self.column(name, n), weights) / total)
@@ -0,0 +1,51 @@
+import time
+
+
+class AdaptiveScheduler:
+    """Temporizador adaptativo para el sondeo del PLC.
+
+    Mientras hay actividad (el PLC está enviando y puede dejar de hacerlo en
+    cualquier momento) sondea cada min_interval; en reposo el intervalo crece
+    multiplicándose por backoff_factor hasta max_interval. Los plazos se
+    calculan sobre el plazo anterior (no se acumulan los tiempos de sleep),
+    así que el ritmo no deriva por lo que tarde cada ciclo.
+    """
+
+    def __init__(self, min_interval=0.2, max_interval=2.0, backoff_factor=2.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Se requiere 0 < min_interval <= max_interval")
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.interval = min_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._deadline = clock()
+
+    def update(self, active):
+        """Ajusta el intervalo según haya actividad en el último ciclo"""
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff_factor, self.max_interval)
+
+    def reset(self):
+        """Vuelve al intervalo mínimo y reinicia el plazo desde ahora"""
+        self.interval = self.min_interval
+        self._deadline = self._clock()
+
+    def next_delay(self):
+        """Avanza el plazo un intervalo y devuelve cuánto falta para él"""
+        now = self._clock()
+        self._deadline += self.interval
+        if self._deadline < now:
+            # Ciclo más lento que el intervalo: no intentar recuperar los plazos perdidos
+            self._deadline = now
+        return self._deadline - now
+
+    def wait(self):
+        delay = self.next_delay()
+        if delay > 0:
+            self._sleep(delay)
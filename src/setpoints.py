@@ -0,0 +1,153 @@
+import logging
+import time
+
+import modbus_tk.defines as cst
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Máximo de registros en una escritura WRITE_MULTIPLE_REGISTERS (la relectura admite hasta 125)
+MAX_WRITE_BLOCK = 123
+
+WRITE_LATENCY = REGISTRY.histogram("dosificacion_escritura_plc_seconds",
+                                   "Duración de cada transacción de escritura de consignas (con verificación)")
+WRITES = REGISTRY.counter("dosificacion_escrituras_plc_total", "Transacciones de escritura de consignas enviadas")
+SUPPRESSED = REGISTRY.counter("dosificacion_escrituras_suprimidas_total",
+                              "Registros no enviados porque el PLC ya tenía ese valor")
+VERIFY_FAILURES = REGISTRY.counter("dosificacion_verificaciones_fallidas_total",
+                                   "Escrituras cuya relectura no coincide con lo enviado")
+
+
+class SetpointVerificationError(Exception):
+    """La relectura de los registros escritos no coincide con los valores enviados"""
+
+
+class SetpointWriter:
+    """Escritura de consignas con supresión de repetidos, agrupación y verificación opcional.
+
+    stage() deja valores pendientes por registro (el último gana) y flush() los
+    envía: se omiten los que coinciden con lo último confirmado en el PLC
+    (salvo los registros 'volatile', p. ej. un flag de handshake que el PLC
+    baja al consumirlo, y salvo que hayan pasado refresh_interval segundos).
+    Un bloque preparado en un mismo stage() que incluye un registro volatile
+    se envía entero: el handshake acompaña siempre a su consigna. Los registros
+    contiguos (o separados por huecos de hasta max_gap registros ya
+    conocidos) van en una sola transacción. Si una escritura falla lo pendiente
+    se conserva y se agrupa con lo siguiente. Con verify=True se relee el
+    bloque escrito y se compara.
+    """
+
+    def __init__(self, unit_id=1, verify=False, refresh_interval=60.0, volatile=(), max_gap=2,
+                 clock=time.monotonic):
+        self.unit_id = unit_id
+        self.verify = verify
+        self.refresh_interval = refresh_interval
+        self.volatile = frozenset(volatile)
+        self.max_gap = max_gap
+        self._clock = clock
+        self._pending = {}
+        self._forced = set()  # registros pendientes que van con un volatile y no se pueden omitir
+        self._confirmed = {}  # registro -> (valor, instante de la última escritura)
+
+    def stage(self, address, values):
+        addresses = range(address, address + len(values))
+        for register, value in zip(addresses, values):
+            self._pending[register] = int(value)
+        if not self.volatile.isdisjoint(addresses):
+            self._forced.update(addresses)
+
+    def invalidate(self):
+        """Olvida lo confirmado (p. ej. tras una caída de la conexión: el PLC pudo reiniciarse)"""
+        self._confirmed.clear()
+
+    def _is_current(self, address, value, now):
+        if address in self.volatile:
+            return False
+        confirmed = self._confirmed.get(address)
+        if confirmed is None or confirmed[0] != value:
+            return False
+        return self.refresh_interval is None or now - confirmed[1] < self.refresh_interval
+
+    def plan(self):
+        """Bloques (inicio, valores) a escribir con lo pendiente; descarta del pendiente lo ya vigente"""
+        now = self._clock()
+        for address, value in list(self._pending.items()):
+            if address not in self._forced and self._is_current(address, value, now):
+                del self._pending[address]
+                SUPPRESSED.inc()
+
+        blocks = []
+        for address in sorted(self._pending):
+            if blocks:
+                start, values = blocks[-1]
+                end = start + len(values)
+                gap = range(end, address)
+                if (len(gap) <= self.max_gap and address - start < MAX_WRITE_BLOCK
+                        and all(missing in self._confirmed for missing in gap)):
+                    # Rellena el hueco con lo que el PLC ya tiene para no partir la transacción
+                    values.extend(self._confirmed[missing][0] for missing in gap)
+                    values.append(self._pending[address])
+                    continue
+            blocks.append((address, [self._pending[address]]))
+        return blocks
+
+    @staticmethod
+    def _request(values):
+        if len(values) == 1:
+            return cst.WRITE_SINGLE_REGISTER, values[0]
+        return cst.WRITE_MULTIPLE_REGISTERS, values
+
+    def _confirm(self, start, values):
+        now = self._clock()
+        for offset, value in enumerate(values):
+            address = start + offset
+            self._confirmed[address] = (value, now)
+            if self._pending.get(address) == value:
+                del self._pending[address]
+                self._forced.discard(address)
+
+    def _check(self, start, values, registers):
+        mismatched = [
+            start + offset for offset, (sent, read) in enumerate(zip(values, registers))
+            if sent != read and start + offset not in self.volatile
+        ]
+        if mismatched:
+            VERIFY_FAILURES.inc()
+            for address in mismatched:
+                self._confirmed.pop(address, None)
+            raise SetpointVerificationError(
+                f"Relectura distinta de lo escrito en los registros {mismatched}: "
+                f"enviado {list(values)}, leído {list(registers)}")
+
+    def flush(self, master):
+        """Envía lo pendiente; devuelve los bloques escritos como [(inicio, valores)]"""
+        blocks = self.plan()
+        for start, values in blocks:
+            begin = time.perf_counter()
+            function_code, output_value = self._request(values)
+            master.execute(self.unit_id, function_code, start, output_value=output_value)
+            WRITES.inc()
+            self._confirm(start, values)
+            if self.verify:
+                self._check(start, values, master.execute(self.unit_id, cst.READ_HOLDING_REGISTERS, start,
+                                                          len(values)))
+            WRITE_LATENCY.observe(time.perf_counter() - begin)
+            logger.debug("Consigna escrita en %s: %s", start, values)
+        return blocks
+
+    async def flush_async(self, master):
+        """Igual que flush() con un maestro asyncio (AsyncTcpMaster)"""
+        blocks = self.plan()
+        for start, values in blocks:
+            begin = time.perf_counter()
+            function_code, output_value = self._request(values)
+            await master.execute(self.unit_id, function_code, start, output_value=output_value)
+            WRITES.inc()
+            self._confirm(start, values)
+            if self.verify:
+                self._check(start, values, await master.execute(self.unit_id, cst.READ_HOLDING_REGISTERS, start,
+                                                                len(values)))
+            WRITE_LATENCY.observe(time.perf_counter() - begin)
+            logger.debug("Consigna escrita en %s: %s", start, values)
+        return blocks
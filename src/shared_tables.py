@@ -0,0 +1,149 @@
+import json
+import logging
+import struct
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from dosing_table import DosingTable
+from table_cache import stack_tables, stacked_shape
+
+logger = logging.getLogger(__name__)
+
+# Cabecera del segmento: longitud del JSON (4 bytes), JSON y relleno hasta alinear el array
+_LENGTH = struct.Struct("<I")
+_ALIGNMENT = 64
+
+
+def _data_offset(header_size):
+    return -(-(_LENGTH.size + header_size) // _ALIGNMENT) * _ALIGNMENT
+
+
+def publish_tables(tables, sheet_names, name=None):
+    """Copia las hojas apiladas a un segmento de memoria compartida y lo devuelve (el llamador lo libera)"""
+    shape = stacked_shape(tables, sheet_names)
+    header = json.dumps({
+        "sheet_names": list(sheet_names),
+        "shapes": [list(tables[sheet].shape) for sheet in sheet_names],
+        "shape": list(shape),
+    }).encode("utf-8")
+
+    offset = _data_offset(len(header))
+    size = offset + int(np.prod(shape)) * np.dtype(float).itemsize
+    segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _LENGTH.pack_into(segment.buf, 0, len(header))
+    segment.buf[_LENGTH.size:_LENGTH.size + len(header)] = header
+    stack_tables(tables, sheet_names, out=np.ndarray(shape, dtype=float, buffer=segment.buf, offset=offset))
+    return segment
+
+
+def attach_tables(name):
+    """Abre un segmento publicado y devuelve (segmento, nombres de hoja, {hoja: vista de solo lectura})"""
+    segment = shared_memory.SharedMemory(name=name)
+    (header_size,) = _LENGTH.unpack_from(segment.buf, 0)
+    header = json.loads(bytes(segment.buf[_LENGTH.size:_LENGTH.size + header_size]))
+
+    stacked = np.ndarray(tuple(header["shape"]), dtype=float, buffer=segment.buf,
+                         offset=_data_offset(header_size))
+    stacked.flags.writeable = False
+    tables = {
+        sheet: stacked[i, :rows, :columns]
+        for i, (sheet, (rows, columns)) in enumerate(zip(header["sheet_names"], header["shapes"]))
+    }
+    return segment, header["sheet_names"], tables
+
+
+class SharedDosingTable(DosingTable):
+    """DosingTable de solo lectura sobre un segmento de memoria compartida publicado por otro proceso.
+
+    No abre el Excel: cuando el proceso que publica detecta cambios crea un
+    segmento nuevo (prefijo-generación) e incrementa 'generation' (un
+    multiprocessing.Value); en la siguiente consulta se abre el nuevo segmento.
+    """
+
+    def __init__(self, prefix, generation):
+        self.prefix = prefix
+        self.generation = generation
+        self.sheet_names = []
+        self.tables = {}
+        self._segment = None
+        self._attached = None
+        self._lock = threading.Lock()
+        self.refresh_if_changed()
+
+    def _attach_latest(self):
+        while True:
+            generation = self.generation.value
+            try:
+                return generation, attach_tables(segment_name(self.prefix, generation))
+            except FileNotFoundError:
+                # Se publicó otra generación mientras tanto y la anterior ya se liberó
+                if self.generation.value == generation:
+                    raise
+
+    def reload(self):
+        with self._lock:
+            generation, (segment, self.sheet_names, self.tables) = self._attach_latest()
+            previous, self._segment, self._attached = self._segment, segment, generation
+            _close_segment(previous)
+        logger.info("Tablas de dosificación compartidas (generación %s): %s", generation, ", ".join(self.sheet_names))
+
+    def refresh_if_changed(self):
+        if self.generation.value == self._attached:
+            return False
+        self.reload()
+        return True
+
+    def close(self):
+        self.tables = {}
+        _close_segment(self._segment)
+        self._segment = None
+
+
+def _close_segment(segment):
+    if segment is None:
+        return
+    try:
+        segment.close()
+    except BufferError:
+        # Aún hay vistas del segmento en uso: se libera cuando el recolector las descarte
+        pass
+
+
+def segment_name(prefix, generation):
+    return f"{prefix}-{generation}"
+
+
+class SharedTablePublisher:
+    """Mantiene las tablas del Excel publicadas en memoria compartida y las vuelve a publicar si cambian"""
+
+    def __init__(self, dosing_table, prefix, generation):
+        self.dosing_table = dosing_table
+        self.prefix = prefix
+        self.generation = generation
+        self._segment = None
+        self.publish()
+
+    def publish(self):
+        generation = self.generation.value + 1
+        segment = publish_tables(self.dosing_table.tables, self.dosing_table.sheet_names,
+                                 name=segment_name(self.prefix, generation))
+        previous, self._segment = self._segment, segment
+        self.generation.value = generation
+        # Los procesos que aún usan el segmento anterior lo conservan mapeado hasta que lo cierren
+        if previous is not None:
+            previous.unlink()
+            _close_segment(previous)
+
+    def refresh_if_changed(self):
+        if not self.dosing_table.refresh_if_changed():
+            return False
+        self.publish()
+        return True
+
+    def close(self):
+        if self._segment is not None:
+            self._segment.unlink()
+            _close_segment(self._segment)
+            self._segment = None
@@ -0,0 +1,115 @@
+import random
+import struct
+import threading
+import time
+
+import modbus_tk.defines as cst
+import modbus_tk.hooks as hooks
+from modbus_tk import modbus_tcp
+
+# Registros que escriben los procesadores: [dosificación x100, 1] en 4-5 (PLCClient) y 300 (PLCExcelDataProcessor)
+DOSING_REGISTERS = (4, 5, 300)
+REGISTER_COUNT = 310
+
+
+def batch_profile(batches=10, samples_per_batch=5, idle_samples=2, dificultad=3, seed=0):
+    """Perfil de lotes: muestras con flag=1 (el PLC envía) seguidas de muestras con flag=0 (fin de lote)"""
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(batches):
+        turbidez = rng.randint(1, 1000)
+        promedio = rng.uniform(1, 65)  # promedio x1000 tiene que caber en un registro de 16 bits
+        for _ in range(samples_per_batch):
+            turbidez = min(max(turbidez + rng.randint(-10, 10), 1), 1000)
+            frames.append((turbidez, int(promedio * 1000), dificultad, 1))
+        frames.extend([(turbidez, int(promedio * 1000), dificultad, 0)] * idle_samples)
+    return frames
+
+
+class PLCSimulator:
+    """PLC Modbus TCP simulado con modbus_tk.
+
+    Reproduce un perfil de (turbidez, promedio x1000, dificultad, flag) en los
+    registros 0-3, cuenta las peticiones recibidas y registra cada escritura de
+    dosificación en los registros 4-5 o 300 con su instante de llegada.
+    """
+
+    def __init__(self, profile, port=5020, address="127.0.0.1", slave_id=1):
+        self.profile = list(profile)
+        self.port = port
+        self.address = address
+        self.slave_id = slave_id
+        self.position = 0
+        self.requests = 0
+        self.writes = []
+        self._server = None
+        self._slave = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _on_request(self, args):
+        slave, request_pdu = args
+        if slave is not self._slave:
+            return None
+
+        self.requests += 1
+        function_code = request_pdu[0]
+        if function_code == cst.WRITE_MULTIPLE_REGISTERS:
+            address, quantity, _ = struct.unpack(">HHB", request_pdu[1:6])
+            values = struct.unpack(f">{quantity}H", request_pdu[6:6 + 2 * quantity])
+        elif function_code == cst.WRITE_SINGLE_REGISTER:
+            address, value = struct.unpack(">HH", request_pdu[1:5])
+            values = (value,)
+        else:
+            return None
+
+        if address in DOSING_REGISTERS:
+            self.writes.append((time.perf_counter(), address, values))
+        return None
+
+    def start(self, step_interval=None):
+        """Arranca el servidor; con step_interval avanza el perfil solo en un hilo"""
+        self._server = modbus_tcp.TcpServer(port=self.port, address=self.address)
+        self._server.start()
+        self._slave = self._server.add_slave(self.slave_id)
+        self._slave.add_block("registros", cst.HOLDING_REGISTERS, 0, REGISTER_COUNT)
+        hooks.install_hook("modbus.Slave.handle_request", self._on_request)
+        self.step()
+
+        if step_interval is not None:
+            self._thread = threading.Thread(target=self._run, args=(step_interval,), daemon=True)
+            self._thread.start()
+
+    def _run(self, step_interval):
+        while not self._stop_event.wait(step_interval):
+            if not self.step():
+                break
+
+    def step(self):
+        """Publica la siguiente muestra del perfil; devuelve False cuando el perfil se ha agotado"""
+        if self.position >= len(self.profile):
+            return False
+        self._slave.set_values("registros", 0, list(self.profile[self.position]))
+        self.position += 1
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        hooks.uninstall_hook("modbus.Slave.handle_request", self._on_request)
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+
+# Ejemplo de uso: simulador en el puerto 5020 que avanza una muestra por segundo
+if __name__ == "__main__":
+    simulator = PLCSimulator(batch_profile(batches=100), port=5020)
+    simulator.start(step_interval=1.0)
+    try:
+        while simulator.position < len(simulator.profile):
+            time.sleep(1)
+    finally:
+        simulator.stop()
+        print(f"Peticiones recibidas: {simulator.requests}, escrituras de dosificación: {len(simulator.writes)}")
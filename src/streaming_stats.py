@@ -0,0 +1,73 @@
+from collections import deque
+
+
+class StreamingStats:
+    """Estadísticas incrementales de una señal (turbidez): EWMA, pendiente y pronóstico.
+
+    La pendiente es la de la regresión lineal sobre las últimas 'window'
+    muestras, mantenida con sumas acumuladas que se actualizan al entrar y
+    salir cada muestra, así que update() es O(1). Cada 'window' muestras las
+    sumas se recalculan desde la ventana para que no acumulen error de redondeo.
+    El eje x es el número de muestra, de modo que la pendiente está en
+    unidades por muestra y forecast(1) es la próxima lectura esperada.
+    """
+
+    def __init__(self, alpha=0.3, window=30):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha debe estar en (0, 1]")
+        if window < 2:
+            raise ValueError("La ventana debe tener al menos 2 muestras")
+
+        self.alpha = alpha
+        self.window = window
+        self.ewma = None
+        self.count = 0
+        self._samples = deque(maxlen=window)
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self._sum_x = self._sum_y = self._sum_xx = self._sum_xy = 0.0
+
+    def _add(self, x, y, sign):
+        self._sum_x += sign * x
+        self._sum_y += sign * y
+        self._sum_xx += sign * x * x
+        self._sum_xy += sign * x * y
+
+    def update(self, value):
+        """Incorpora una muestra nueva y devuelve la EWMA actualizada"""
+        value = float(value)
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+
+        x = float(self.count)
+        if len(self._samples) == self.window:
+            self._add(*self._samples[0], sign=-1)
+        self._samples.append((x, value))
+        self._add(x, value, sign=1)
+        self.count += 1
+
+        if self.count % self.window == 0:
+            self._reset_sums()
+            for sample_x, sample_y in self._samples:
+                self._add(sample_x, sample_y, sign=1)
+
+        return self.ewma
+
+    def slope(self):
+        """Pendiente (unidades por muestra) de la regresión en la ventana, o None con menos de 2 muestras"""
+        n = len(self._samples)
+        if n < 2:
+            return None
+        denominator = n * self._sum_xx - self._sum_x ** 2
+        if denominator == 0:
+            return None
+        return (n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+
+    def forecast(self, horizon=1):
+        """Valor esperado 'horizon' muestras después de la última, según la recta de la ventana"""
+        slope = self.slope()
+        if slope is None:
+            return self.ewma
+        n = len(self._samples)
+        intercept = (self._sum_y - slope * self._sum_x) / n
+        return intercept + slope * (self.count - 1 + horizon)
@@ -0,0 +1,120 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from band_index import COLUMN_RANGES, FIRST_COLUMN_INDEX, FIRST_ROW_INDEX
+
+logger = logging.getLogger(__name__)
+
+# Sube este número si cambia el formato del caché para forzar su reconstrucción
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".tablas"
+
+
+def default_cache_paths(excel_path):
+    """Rutas del caché junto al libro: datos.xlsx -> datos.tablas.npy + datos.tablas.json"""
+    base = os.path.splitext(excel_path)[0] + CACHE_SUFFIX
+    return base + ".npy", base + ".json"
+
+
+def _normalize(fingerprint):
+    # Las tuplas pasan a listas al guardarlas en JSON: comparar siempre en la forma serializada
+    return json.loads(json.dumps(fingerprint))
+
+
+def _expected_header(fingerprint, sheet_names):
+    return {
+        "version": CACHE_VERSION,
+        "fingerprint": _normalize(fingerprint),
+        "sheet_names": list(sheet_names),
+        "column_ranges": [list(band) for band in COLUMN_RANGES],
+        "first_row_index": FIRST_ROW_INDEX,
+        "first_column_index": FIRST_COLUMN_INDEX,
+    }
+
+
+def stacked_shape(tables, sheet_names):
+    """Forma (hojas, filas, columnas) que ocupan las hojas apiladas"""
+    rows = max(tables[name].shape[0] for name in sheet_names)
+    columns = max(tables[name].shape[1] for name in sheet_names)
+    return len(sheet_names), rows, columns
+
+
+def stack_tables(tables, sheet_names, out=None):
+    """Apila las hojas en un array (hoja, fila, columna), rellenando con NaN si difieren en tamaño
+
+    Con 'out' se escribe en un array ya reservado (p. ej. sobre memoria compartida).
+    """
+    if out is None:
+        out = np.empty(stacked_shape(tables, sheet_names))
+    out[...] = np.nan
+    for i, name in enumerate(sheet_names):
+        table = tables[name]
+        out[i, :table.shape[0], :table.shape[1]] = table
+    return out
+
+
+def save_tables(tables, sheet_names, fingerprint, cache_path):
+    """Guarda las hojas apiladas (hoja, fila, columna) en un .npy y la cabecera en un .json
+
+    Se escriben primero en temporales y se renombran (el .json el último), de
+    modo que un proceso que lea a la vez nunca ve un caché a medio escribir.
+    """
+    npy_path, header_path = cache_path
+    stacked = stack_tables(tables, sheet_names)
+
+    header = _expected_header(fingerprint, sheet_names)
+    header["shapes"] = [list(tables[name].shape) for name in sheet_names]
+
+    os.makedirs(os.path.dirname(os.path.abspath(npy_path)), exist_ok=True)
+    tmp_npy = npy_path + ".tmp"
+    tmp_header = header_path + ".tmp"
+    with open(tmp_npy, "wb") as f:
+        np.save(f, stacked)
+    with open(tmp_header, "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+    os.replace(tmp_npy, npy_path)
+    os.replace(tmp_header, header_path)
+
+
+def load_tables(sheet_names, fingerprint, cache_path):
+    """Abre el caché con mmap si corresponde a la huella actual del libro; si no, devuelve None"""
+    npy_path, header_path = cache_path
+    try:
+        with open(header_path, encoding="utf-8") as f:
+            header = json.load(f)
+        shapes = header.pop("shapes")
+        if header != _expected_header(fingerprint, sheet_names):
+            return None
+        stacked = np.load(npy_path, mmap_mode="r")
+    except (OSError, ValueError, KeyError):
+        return None
+
+    if stacked.ndim != 3 or stacked.shape[0] != len(sheet_names):
+        return None
+
+    # Cada hoja es una vista de solo lectura sobre el mismo mapa de memoria
+    return {
+        name: stacked[i, :rows, :columns]
+        for i, (name, (rows, columns)) in enumerate(zip(sheet_names, shapes))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compila las hojas de dificultad del Excel en un caché binario")
+    parser.add_argument("excel", nargs="?", default="data/datos.xlsx")
+    args = parser.parse_args()
+
+    from dosing_table import DosingTable
+
+    table = DosingTable(args.excel, use_cache=False)
+    table.write_cache()
+    print(f"Caché generado en {table.cache_path[0]} ({', '.join(table.sheet_names)})")
+
+
+# Ejemplo de uso: python src/table_cache.py data/datos.xlsx
+if __name__ == "__main__":
+    main()
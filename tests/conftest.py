@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos viven planos en src/ y se importan por nombre, igual que al ejecutarlos
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
@@ -0,0 +1,61 @@
+import socket
+import time
+
+import pytest
+from modbus_tk import modbus_tcp
+
+from pipeline import CLIENT_DOSING_REGISTER, RegisterActuator
+from simulator import PLCSimulator, batch_profile
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def plc():
+    simulator = PLCSimulator(batch_profile(batches=1), port=free_port())
+    simulator.start()
+    time.sleep(0.3)
+    master = modbus_tcp.TcpMaster(host=simulator.address, port=simulator.port, timeout_in_sec=2.0)
+    yield simulator, master
+    master.close()
+    simulator.stop()
+
+
+def decision(address, valores):
+    return {"registro": address, "valores": list(valores)}
+
+
+def test_handshake_se_envia_siempre_con_su_consigna(plc):
+    simulator, master = plc
+    actuator = RegisterActuator(CLIENT_DOSING_REGISTER, scale=100, trailer=(1,))
+
+    written = [actuator.actuate(master, decision(CLIENT_DOSING_REGISTER, (550, 1))) for _ in range(3)]
+
+    writes = [(address, values) for _, address, values in simulator.writes]
+    assert writes == [(CLIENT_DOSING_REGISTER, (550, 1))] * 3
+    assert written == [True] * 3
+
+
+def test_consigna_sin_handshake_no_se_reenvia(plc):
+    simulator, master = plc
+    actuator = RegisterActuator(300)
+
+    written = [actuator.actuate(master, decision(300, (550,))) for _ in range(3)]
+
+    writes = [(address, values) for _, address, values in simulator.writes]
+    assert writes == [(300, (550,))]
+    assert written == [True, False, False]
+
+
+def test_solo_cuenta_la_escritura_del_registro_de_consigna(plc):
+    _, master = plc
+    actuator = RegisterActuator(300)
+    actuator.actuate(master, decision(300, (550,)))
+
+    # Un bloque que solo lleva otros registros (p. ej. el handshake) no es una dosificación enviada
+    actuator.setpoints.stage(301, (1,))
+    assert actuator.actuate(master, decision(300, (550,))) is False